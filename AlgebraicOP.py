@@ -1,147 +1,337 @@
-def readPGM(filePath):
+import ast
+import collections
+import contextlib
+import functools
+
+import numpy as np
+
+from ImageIO import openOutput, pixelType, readPGM, writeHeader, writeRows
+
+def readChannels(filePath):
     """
-    Read a pgm file and return their header except format type and comment 
-    and return number of pixels.
+    Read a ppm (P3 or P6) file and return three color channels(rgb) of image.
+    Each channel is a view of pixels so nothing is copied.
 
     Parameter:
-    filePath(str): A path to pgm file.
+    filePath(str): A path to ppm file.
 
     Returns:
     width(int): Width of image.
     height(int): Height of image.
     maxGrayLevel(int): Max value of gray scale.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    channels(dict): Three color channels(rgb) of image.
 
     Raise:
-    ValueError: If the file type is not a P5 format.
+    ValueError: If the file is not a color image.
     """
 
-    file = open(filePath,"rb")
+    width, height, maxGrayLevel, pixels = readPGM(filePath)
+    if pixels.ndim != 3:
+        raise ValueError("not a PPM P3/P6 color image")
+    channels = {'r': pixels[..., 0], 'g': pixels[..., 1], 'b': pixels[..., 2]}
 
-    fileType = file.readline().decode().strip()
-    if fileType != "P5":
-        raise ValueError("not a PGM P5 format")
-    
-    while True:
-        line = file.readline().decode().strip()
-        if not line.startswith('#'):
-            dimension = line
-            break
+    return width, height, maxGrayLevel, channels
 
-    maxGrayLevel = int(file.readline().decode().strip())
-    width, height = map(int, dimension.split())
+OPERATORS = {'+': ast.Add, '-': ast.Sub, '*': ast.Mult, '/': ast.Div, '**': ast.Pow}
 
-    pixel_data = file.read()
-    pixels = [ list(pixel_data[row * width : (row + 1) * width]) for row in range(height)]
+UFUNCS = {ast.Add: np.add,
+          ast.Sub: np.subtract,
+          ast.Mult: np.multiply,
+          ast.Div: np.true_divide,
+          ast.Pow: np.power}
 
-    return width, height, maxGrayLevel, pixels
+# number of pixels of one tile, small enough that every temporary stays in cache
+TILE_PIXELS = 1 << 16
 
-def writePGM(filePath, header, pixels):
+@functools.lru_cache(maxsize=256)
+def compileExpression(expression):
     """
-    Write binary pgm file from file path, header and pixels.
-    
+    Parse arithmetic expression of images and check that it contains only
+    numbers, names and operators +, -, *, /, **.
+
+    Parameter:
+    expression(str): Expression e.g. "2*g - r - b".
+
+    Returns:
+    tree(ast.expr): Syntax tree of expression.
+    names(frozenset): Names that used in expression.
+    isFloat(bool): True if expression needs float arithmetic.
+
+    Raise:
+    ValueError: If expression contains anything else.
+    """
+
+    try:
+        tree = ast.parse(expression, mode='eval').body
+    except SyntaxError:
+        raise ValueError(f"Invalid expression: {expression}")
+
+    names = set()
+    isFloat = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in UFUNCS:
+                raise ValueError(f"Invalid operator in expression: {expression}")
+            isFloat = isFloat or isinstance(node.op, (ast.Div, ast.Pow))
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.UAdd, ast.USub)):
+                raise ValueError(f"Invalid operator in expression: {expression}")
+        elif isinstance(node, ast.Constant):
+            if type(node.value) not in (int, float):
+                raise ValueError(f"Invalid constant in expression: {expression}")
+            isFloat = isFloat or isinstance(node.value, float)
+        elif isinstance(node, ast.Name):
+            names.add(node.id)
+        elif not isinstance(node, (ast.operator, ast.unaryop, ast.expr_context)):
+            raise ValueError(f"Invalid expression: {expression}")
+
+    return tree, frozenset(names), isFloat
+
+def evaluateNode(node, values, dtype, shared, memo):
+    """
+    Evaluate syntax tree of expression on one tile.
+    Sub-expressions that appear more than once are computed only once per tile.
+
     Parameters:
-    filePath(str): A path of output file.
-    header(list): List of header of PGM file. 
-    pixels(bytes): Pixels of output image.
+    node(ast.expr): Syntax tree of expression.
+    values(dict): Tile of each image or number of each name.
+    dtype(np.dtype): Wide dtype of intermediate result.
+    shared(dict): Key of each shared sub-expression by id of its node.
+    memo(dict): Result of shared sub-expressions of this tile by key.
+
+    Returns:
+    result(np.ndarray or number): Result of expression.
+    owned(bool): True if result is a temporary array that can be overwritten.
     """
-    
-    file = open(filePath, "wb")
-    file.write("\n".join(header).encode() + b"\n")
-    file.write(pixels)
 
-def writePixelsToPGM(filePathOutput , width, height, maxGrayLevel, pixels):
+    key = shared.get(id(node))
+    if key is None:
+        return applyNode(node, values, dtype, shared, memo)
+    if key not in memo:
+        memo[key], _ = applyNode(node, values, dtype, shared, memo)
+    return memo[key], False
+
+def applyNode(node, values, dtype, shared, memo):
     """
-    Write pixels to PGM file.
-    
+    Apply operator of one node of syntax tree to its evaluated operands.
+    Intermediate arrays are reused as output of the next operator.
+
     Parameters:
-    filePathOutput(str): A path of output file.
-    width(int): Width of image.
-    height(int): Height of image.
-    maxGrayLevel(int): Max value of gray scale of image.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    node(ast.expr): Syntax tree of expression.
+    values(dict): Tile of each image or number of each name.
+    dtype(np.dtype): Wide dtype of intermediate result.
+    shared(dict): Key of each shared sub-expression by id of its node.
+    memo(dict): Result of shared sub-expressions of this tile by key.
+
+    Returns:
+    result(np.ndarray or number): Result of expression.
+    owned(bool): True if result is a temporary array that can be overwritten.
     """
-    
-    header = ["P5", str(width)+" "+str(height), str(maxGrayLevel)]
-    pixels2Dto1D = bytes(sum(pixels, []))
-    pixels = pixels2Dto1D
-    writePGM(filePathOutput, header, pixels)
 
-def combineLists(pixelsA, operator, pixelsB):
+    if isinstance(node, ast.Constant):
+        return node.value, False
+    if isinstance(node, ast.Name):
+        return values[node.id], False
+    if isinstance(node, ast.UnaryOp):
+        operand, owned = evaluateNode(node.operand, values, dtype, shared, memo)
+        if isinstance(node.op, ast.UAdd):
+            return operand, owned
+        if not isinstance(operand, np.ndarray):
+            return -operand, False
+        if owned:
+            return np.negative(operand, out=operand), True
+        return np.negative(operand, dtype=dtype), True
+
+    left, leftOwned = evaluateNode(node.left, values, dtype, shared, memo)
+    right, rightOwned = evaluateNode(node.right, values, dtype, shared, memo)
+    ufunc = UFUNCS[type(node.op)]
+    if not isinstance(left, np.ndarray) and not isinstance(right, np.ndarray):
+        return ufunc(left, right), False
+    if leftOwned:
+        return ufunc(left, right, out=left), True
+    if rightOwned:
+        return ufunc(left, right, out=right), True
+    return ufunc(left, right, dtype=dtype), True
+
+def findSharedNodes(trees):
+    """
+    Find sub-expressions that appear more than once in the expressions.
+
+    Parameter:
+    trees(list): Syntax tree of each expression.
+
+    Return:
+    shared(dict): Key of each shared sub-expression by id of its node.
+    """
+
+    keys = {}
+    for tree in trees:
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+                keys[id(node)] = ast.dump(node)
+    counts = collections.Counter(keys.values())
+
+    return {nodeId: key for nodeId, key in keys.items() if counts[key] > 1}
+
+def evaluateBatch(expressions, maxGrayLevel=255, outputs=None, **values):
+    """
+    Evaluate many arithmetic expressions of the same images in one tiled pass.
+    Each tile of every image is read once, sub-expressions that the expressions
+    share (e.g. r + g + b) are computed once per tile, and each result is
+    saturated to [0, maxGrayLevel] only once at the end. Results that go to
+    a file are written tile by tile as soon as the tile is done.
+
+    Parameters:
+    expressions(dict or list): Expression of each output name
+    e.g. {"excessGreen2": "3*g - (r + g + b)"} or list of (name, expression).
+    maxGrayLevel(int): Max value of gray scale of output images.
+    outputs(dict): Output of each name, a path or binary file object to write
+    pgm file or a preallocated np.ndarray. Outputs that are missing are allocated.
+    values: Image (list or np.ndarray) or number of each name in expressions.
+
+    Return:
+    outputPixels(dict): Result image of each output name that is not written to a file.
+
+    Raise:
+    ValueError: If an expression is invalid, a name is missing or images have different shape.
+    """
+
+    expressions = dict(expressions)
+    outputs = outputs or {}
+    compiled = {name: compileExpression(expression) for name, expression in expressions.items()}
+    names = frozenset().union(*(names for _, names, _ in compiled.values()))
+    missing = names - values.keys()
+    if missing:
+        raise ValueError(f"Missing value of {', '.join(sorted(missing))}")
+
+    isFloat = any(isFloat for _, _, isFloat in compiled.values())
+    images = {}
+    numbers = {}
+    for name in names:
+        if np.ndim(values[name]) == 0:
+            numbers[name] = values[name]
+            isFloat = isFloat or isinstance(values[name], float)
+        else:
+            images[name] = np.asarray(values[name])
+            isFloat = isFloat or images[name].dtype.kind == 'f'
+    if not images:
+        raise ValueError("Expression must contain at least one image")
+
+    shape = next(iter(images.values())).shape
+    if any(image.shape != shape for image in images.values()):
+        raise ValueError("Images must have the same shape")
+
+    dtype = np.dtype(np.float64 if isFloat else np.int64)
+    fileType = pixelType(maxGrayLevel)
+    shared = findSharedNodes([tree for tree, _, _ in compiled.values()])
+    rowPixels = max(1, int(np.prod(shape[1:])))
+    step = max(1, TILE_PIXELS // rowPixels)
+
+    with contextlib.ExitStack() as stack, np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        outputPixels = {}
+        files = {}
+        for name in expressions:
+            target = outputs.get(name)
+            if target is None:
+                outputPixels[name] = np.empty(shape, dtype=fileType.newbyteorder('='))
+            elif isinstance(target, np.ndarray):
+                outputPixels[name] = target
+            else:
+                files[name] = stack.enter_context(openOutput(target))
+                writeHeader(files[name], shape[1], shape[0], maxGrayLevel, len(shape) == 3)
+
+        for start in range(0, shape[0], step):
+            tile = dict(numbers)
+            for name, image in images.items():
+                tile[name] = image[start:start + step]
+            tileShape = (min(step, shape[0] - start),) + shape[1:]
+            memo = {}
+
+            for name, (tree, _, _) in compiled.items():
+                value, owned = evaluateNode(tree, tile, dtype, shared, memo)
+                if owned:
+                    result = value
+                else:
+                    result = np.empty(tileShape, dtype=dtype)
+                    result[...] = value
+                if isFloat:
+                    np.nan_to_num(result, copy=False, nan=0)
+                    np.rint(result, out=result)
+                np.clip(result, 0, maxGrayLevel, out=result)
+
+                if name in files:
+                    writeRows(files[name], result, fileType)
+                else:
+                    outputPixels[name][start:start + step] = result
+
+    return outputPixels
+
+def evaluate(expression, maxGrayLevel=255, out=None, **values):
+    """
+    Evaluate arithmetic expression of images in one pass over the images.
+    Images are processed tile by tile with wide intermediate dtype and the result
+    is saturated to [0, maxGrayLevel] only once at the end.
+
+    Parameters:
+    expression(str): Expression e.g. "2*g - r - b".
+    maxGrayLevel(int): Max value of gray scale of output image.
+    out(np.ndarray): Preallocated output image or None.
+    values: Image (list or np.ndarray) or number of each name in expression.
+
+    Return:
+    outputPixels(np.ndarray): Result image of expression.
+
+    Raise:
+    ValueError: If expression is invalid, a name is missing or images have different shape.
+    """
+
+    outputs = None if out is None else {expression: out}
+
+    return evaluateBatch({expression: expression}, maxGrayLevel, outputs, **values)[expression]
+
+def combineLists(pixelsA, operator, pixelsB, maxGrayLevel=255):
     """
     Combine pixels a and b according to operator.
     
     Parameters:
-    pixelA(list): 2D list of first pixels.
+    pixelA(list or np.ndarray): 2D first pixels.
     operator(str): Arithmatic operator e.g. '+', '-'.
-    pixelB(list): 2D list of second pixels.
+    pixelB(list or np.ndarray): 2D second pixels.
+    maxGrayLevel(int): Max value of gray scale of output image.
     
     Return:
-    outputPixels(list): 2D list of result from combine two lists.
+    outputPixels(np.ndarray): 2D result from combine two images.
+
+    Raise:
+    ValueError: If operator is invalid.
     """
     
-    width = len(pixelsA[0])
-    height = len(pixelsA)
-    outputPixels = [[0]*width for x in range(height)]
-    
-    op = {'+': lambda x, y: x + y,
-            '-': lambda x, y: x - y,
-            '*': lambda x, y: x * y,
-            '/': lambda x, y: x / y,
-            '**': lambda x, y: x ** y}
-    operator = op[operator]
-    if not operator:
+    if operator not in OPERATORS:
         raise ValueError("Invalid operator")
     
-    for x in range(height):
-        for y in range(width):
-            result = operator (pixelsA[x][y], pixelsB[x][y])
-            if result > 255:
-                outputPixels[x][y] = 255
-            elif result < 0:
-                outputPixels[x][y] = 0
-            else:
-                outputPixels[x][y] = result
-                    
-    return outputPixels
+    return evaluate(f"a {operator} b", maxGrayLevel, a=pixelsA, b=pixelsB)
 
-def combineNumAndList(num, operator, pixels):
+def combineNumAndList(num, operator, pixels, maxGrayLevel=255):
     """
     Combine pixels and number according to operator.
     
     Parameters:
     num(int or float): Number.
     operator(str): Arithmatic operator e.g. '+', '-'.
-    pixels(list): 2D list of pixels.
+    pixels(list or np.ndarray): 2D pixels.
+    maxGrayLevel(int): Max value of gray scale of output image.
     
     Return:
-    outputPixels(list): 2D list of result from combine list and number.
+    outputPixels(np.ndarray): 2D result from combine image and number.
+
+    Raise:
+    ValueError: If operator is invalid.
     """
     
-    width = len(pixels[0])
-    height = len(pixels)
-    outputPixels = [[0]*width for x in range(height)]
-    
-    op = {'+': lambda x, y: x + y,
-            '-': lambda x, y: x - y,
-            '*': lambda x, y: x * y,
-            '/': lambda x, y: x / y,
-            '**': lambda x, y: x ** y}
-    operator = op[operator]
-    if not operator:
+    if operator not in OPERATORS:
         raise ValueError("Invalid operator")
     
-    for x in range(height):
-        for y in range(width):
-            result = operator (num, pixels[x][y])
-            if result > 255:
-                outputPixels[x][y] = 255
-            elif result < 0:
-                outputPixels[x][y] = 0
-            else:
-                outputPixels[x][y] = result
-                        
-    return outputPixels
+    return evaluate(f"num {operator} a", maxGrayLevel, num=num, a=pixels)
 
 def excessGreen(num, channels):
     """
@@ -152,17 +342,10 @@ def excessGreen(num, channels):
     channels(dict): Three color channels(rgb) of image.
     
     Return:
-    excessGreen(list): Excess green channel image. 
+    excessGreen(np.ndarray): Excess green channel image. 
     """
     
-    r = channels['r']
-    g = channels['g']
-    b = channels['b']
-    multiG = combineNumAndList(num, '*', g)
-    multiGDiffRed = combineLists(multiG, '-', r)
-    excessGreen = combineLists(multiGDiffRed, '-', b)
-    
-    return excessGreen
+    return evaluate("num*g - r - b", num=num, **channels)
 
 def excessBlue(num, channels):
     """
@@ -173,17 +356,10 @@ def excessBlue(num, channels):
     channels(dict): Three color channels(rgb) of image.
     
     Return:
-    excessBlue(list): Excess blue channel image. 
+    excessBlue(np.ndarray): Excess blue channel image. 
     """
     
-    r = channels['r']
-    g = channels['g']
-    b = channels['b']
-    multiB = combineNumAndList(num, '*', b)
-    multiBDiffGreen = combineLists(multiB, '-', g)
-    excessBlue = combineLists(multiBDiffGreen, '-', r)
-    
-    return excessBlue
+    return evaluate("num*b - g - r", num=num, **channels)
 
 def excessRed(num, channels):
     """
@@ -194,17 +370,10 @@ def excessRed(num, channels):
     channels(dict): Three color channels(rgb) of image.
     
     Return:
-    excessRed(list): Excess red channel image. 
+    excessRed(np.ndarray): Excess red channel image. 
     """
     
-    r = channels['r']
-    g = channels['g']
-    b = channels['b']
-    multiR = combineNumAndList(num, '*', r)
-    multiRDiffBlue = combineLists(multiR, '-', b)
-    excessRed = combineLists(multiRDiffBlue, '-', g)
-    
-    return excessRed
+    return evaluate("num*r - b - g", num=num, **channels)
 
 def intensity(num, channels):
     """
@@ -215,17 +384,10 @@ def intensity(num, channels):
     channels(dict): Three color channels(rgb) of image.
     
     Return:
-    intensity(list): Intensity image. 
+    intensity(np.ndarray): Intensity image. 
     """
     
-    r = channels['r']
-    g = channels['g']
-    b = channels['b']
-    rbAdd = combineLists(r, '+', b)
-    rbAddg = combineLists(rbAdd, '+', g)
-    intensity = combineNumAndList(num, '*', rbAddg)
-    
-    return intensity
+    return evaluate("num*(r + b + g)", num=num, **channels)
 
 # def showImages(titles, images):
     plt.subplot(2, 3, 1)
@@ -256,57 +418,46 @@ def intensity(num, channels):
     plt.show()
 
 # main
-filePathInR = "in/SanFranPeak_red.pgm"
-filePathInG = "in/SanFranPeak_green.pgm"
-filePathInB = "in/SanFranPeak_blue.pgm"
-
-width, height, maxGrayLevel, r = readPGM(filePathInR)
-width, height, maxGrayLevel, g = readPGM(filePathInG)
-width, height, maxGrayLevel, b = readPGM(filePathInB)
-channels = {'r': r, 'g': g, 'b': b}
-
-# combine images
-excessGreen2 = excessGreen(2, channels)
-excessGreen3 = excessGreen(3, channels)
-excessGreen5 = excessGreen(5, channels)
-
-excessBlue2 = excessBlue(2, channels)
-excessBlue3 = excessBlue(3, channels)
-excessBlue5 = excessBlue(5, channels)
-
-excessRed2 = excessRed(2, channels)
-excessRed3 = excessRed(3, channels)
-excessRed5 = excessRed(5, channels)
-
-# rbDiff = combineLists(combineLists(r,'-', b), '-', g)
-# intensityChannel = intensity(1/3, channels)
-
-rgAdd = combineLists(r, '+', g)
-gbAdd = combineLists(g, '+', b)
-addAll = combineLists(rgAdd, '+', b)
-
-# write PGM file
-filePathsOut = ["excessGreen2.pgm", "excessGreen3.pgm", "excessGreen5.pgm",
-               "excessBlue2.pgm", "excessBlue3.pgm", "excessBlue5.pgm",
-               "excessRed2.pgm", "excessRed3.pgm", "excessRed5.pgm",
-               "rgAdd.pgm", "addAll.pgm", "gbAdd.pgm"
-               ]
-pixelsImages = [excessGreen2, excessGreen3, excessGreen5,
-                excessBlue2, excessBlue3, excessBlue5,
-                excessRed2, excessRed3, excessRed5,
-                rgAdd, addAll, gbAdd
-                ]
-for i in range(len(filePathsOut)):
-    writePixelsToPGM("out/"+filePathsOut[i], width, height, maxGrayLevel, pixelsImages[i])
-
-# titles = ["2*g-r-b", "r-b", "(r+b+g)/3"]
-# images = [excessGreen2, rbDiff, intensityChannel]
-# titles = ["2*g-r-b", "3*g-r-b", "5*g-r-b"]
-# images = [excessGreen2, excessGreen3, excessGreen5]
-# titles = ["2*b-g-r", "3*b-g-r", "5*b-g-r"]
-# images = [excessBlue2, excessBlue3, excessBlue5]
-# titles = ["2*r-g-b", "3*r-g-b", "5*r-g-b"]
-# images = [excessRed2, excessRed3, excessRed5]
-# titles = ['r+g', 'r+g+b', 'g+b']
-# images = [rgAdd, addAll, gbAdd]
-# showImages(titles, images)
+if __name__ == "__main__":
+    filePathInR = "in/SanFranPeak_red.pgm"
+    filePathInG = "in/SanFranPeak_green.pgm"
+    filePathInB = "in/SanFranPeak_blue.pgm"
+
+    width, height, maxGrayLevel, r = readPGM(filePathInR)
+    width, height, maxGrayLevel, g = readPGM(filePathInG)
+    width, height, maxGrayLevel, b = readPGM(filePathInB)
+    channels = {'r': r, 'g': g, 'b': b}
+
+    # combine images, num*c - others = (num+1)*c - (r+g+b) so that r+g+b is shared
+    expressions = {"excessGreen2.pgm": "3*g - (r + g + b)",
+                   "excessGreen3.pgm": "4*g - (r + g + b)",
+                   "excessGreen5.pgm": "6*g - (r + g + b)",
+                   "excessBlue2.pgm": "3*b - (r + g + b)",
+                   "excessBlue3.pgm": "4*b - (r + g + b)",
+                   "excessBlue5.pgm": "6*b - (r + g + b)",
+                   "excessRed2.pgm": "3*r - (r + g + b)",
+                   "excessRed3.pgm": "4*r - (r + g + b)",
+                   "excessRed5.pgm": "6*r - (r + g + b)",
+                   "rgAdd.pgm": "r + g",
+                   "addAll.pgm": "r + g + b",
+                   "gbAdd.pgm": "g + b"
+                   }
+
+    # rbDiff = combineLists(combineLists(r,'-', b), '-', g)
+    # intensityChannel = intensity(1/3, channels)
+
+    # write PGM file while computing
+    outputs = {name: "out/"+name for name in expressions}
+    evaluateBatch(expressions, maxGrayLevel, outputs, **channels)
+
+    # titles = ["2*g-r-b", "r-b", "(r+b+g)/3"]
+    # images = [excessGreen2, rbDiff, intensityChannel]
+    # titles = ["2*g-r-b", "3*g-r-b", "5*g-r-b"]
+    # images = [excessGreen2, excessGreen3, excessGreen5]
+    # titles = ["2*b-g-r", "3*b-g-r", "5*b-g-r"]
+    # images = [excessBlue2, excessBlue3, excessBlue5]
+    # titles = ["2*r-g-b", "3*r-g-b", "5*r-g-b"]
+    # images = [excessRed2, excessRed3, excessRed5]
+    # titles = ['r+g', 'r+g+b', 'g+b']
+    # images = [rgAdd, addAll, gbAdd]
+    # showImages(titles, images)
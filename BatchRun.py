@@ -0,0 +1,408 @@
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+import Pipeline
+from AlgebraicOP import evaluateBatch, readChannels
+from GeometricOP import BORDERS, INTERPOLATIONS, loadWarpMap
+from Histogram import createHistogram
+from ImageIO import readPGM
+from ObjectMoment import featureTable
+
+# suffix of output file of each command
+OUTPUTS = {
+    'equalize': '_equalized.pgm',
+    'histogram': '_histogram.csv',
+    'moments': '_moments.csv',
+    'warp': '_warped.pgm',
+    'algebra': '_algebra.pgm',
+}
+
+# file of content hashes of finished outputs in output directory
+MANIFEST = '.batchrun.json'
+
+# bytes of file read at once when hashing
+HASH_BLOCK = 1 << 20
+
+def outputPath(command, relativePath, outputDirectory):
+    """
+    Return path of output file of input file. Output keeps the path of input
+    relative to its glob root, so inputs with the same name in different
+    directories do not share an output.
+
+    Parameters:
+    command(str): Name of command.
+    relativePath(str): Path of input file relative to root of its glob pattern.
+    outputDirectory(str): Directory of output files.
+
+    Return:
+    path(str): A path of output file.
+    """
+
+    stem = os.path.splitext(relativePath)[0]
+    return os.path.normpath(os.path.join(outputDirectory, stem + OUTPUTS[command]))
+
+def patternRoot(pattern):
+    """
+    Return directory of glob pattern before its first wildcard.
+
+    Parameter:
+    pattern(str): Glob pattern e.g. 'in/**/*.pgm'.
+
+    Return:
+    root(str): Directory e.g. 'in'.
+    """
+
+    parts = pattern.split(os.sep)
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            break
+    else:
+        i = len(parts) - 1
+    return os.sep.join(parts[:i]) or (os.sep if pattern.startswith(os.sep) else os.curdir)
+
+def isInside(path, directory):
+    """
+    Return True if path is directory or is in directory tree.
+    """
+
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+def findInputs(patterns, outputDirectory):
+    """
+    Find input files of glob patterns with path of each relative to root of its
+    pattern. Files in output directory are left out, so outputs of the last run
+    are not processed again when output directory is inside input tree.
+
+    Parameters:
+    patterns(list): Glob patterns, ** is recursive.
+    outputDirectory(str): Directory of output files.
+
+    Return:
+    inputs(list): Sorted list of (inputPath, relativePath).
+
+    Raise:
+    ValueError: If root of a pattern is in output directory.
+    """
+
+    inputs = {}
+    for pattern in patterns:
+        root = patternRoot(pattern)
+        if isInside(root, outputDirectory):
+            raise ValueError(f"input {pattern} is in output directory {outputDirectory}")
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and not isInside(path, outputDirectory):
+                inputs.setdefault(path, os.path.relpath(path, root))
+    return sorted(inputs.items())
+
+def dependencies(command, options):
+    """
+    Return files other than input that output of command depends on.
+
+    Parameters:
+    command(str): Name of command.
+    options(dict): Options of command.
+
+    Return:
+    paths(list): List of paths.
+    """
+
+    return [options['map']] if command == 'warp' else []
+
+def isNewer(outputPath, inputPaths):
+    """
+    Return True if output file exists and is not older than every input file.
+
+    Parameters:
+    outputPath(str): A path of output file.
+    inputPaths(list): Paths of input files.
+
+    Return:
+    isNewer(bool): True if output is up to date.
+    """
+
+    try:
+        outputTime = os.stat(outputPath).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(os.stat(path).st_mtime_ns <= outputTime for path in inputPaths)
+
+def contentDigest(command, options, inputPaths):
+    """
+    Hash command, options and content of input files.
+
+    Parameters:
+    command(str): Name of command.
+    options(dict): Options of command.
+    inputPaths(list): Paths of input files.
+
+    Return:
+    digest(str): Hex digest.
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([command, options], sort_keys=True).encode())
+    for path in inputPaths:
+        with open(path, 'rb') as file:
+            while block := file.read(HASH_BLOCK):
+                digest.update(block)
+    return digest.hexdigest()
+
+def writeTable(filePath, table):
+    """
+    Write columns of table to csv file with header line.
+
+    Parameters:
+    filePath(str): A path of output file.
+    table(dict): Column of each name, np.ndarray of the same length.
+    """
+
+    columns = np.column_stack([np.asarray(column, dtype=np.float64) for column in table.values()])
+    np.savetxt(filePath, columns.reshape(-1, len(table)), fmt='%.10g', delimiter=',',
+               header=','.join(table), comments='')
+
+def process(command, inputPath, outputPath, options):
+    """
+    Run one command on one file. Images are streamed tile by tile so memory of
+    a worker is bounded by a few tiles, not by size of image.
+
+    Parameters:
+    command(str): Name of command.
+    inputPath(str): A path to input pgm or ppm file.
+    outputPath(str): A path of output file.
+    options(dict): Options of command.
+
+    Raise:
+    ValueError: If the file cannot be processed.
+    """
+
+    if command == 'equalize':
+        Pipeline.read(inputPath).equalize().write(outputPath)
+    elif command == 'warp':
+        stage = Pipeline.read(inputPath).warp(loadWarpMap(options['map']), options['interpolation'],
+                                              options['border'], options['borderValue'])
+        stage.write(outputPath)
+    elif command == 'algebra':
+        width, height, maxGrayLevel, pixels = readPGM(inputPath)
+        values = readChannels(inputPath)[3] if pixels.ndim == 3 else {'p': pixels}
+        del pixels
+        maxGrayLevel = options['maxGrayLevel'] or maxGrayLevel
+        evaluateBatch({'output': options['expression']}, maxGrayLevel, {'output': outputPath}, **values)
+    elif command == 'histogram':
+        width, height, maxGrayLevel, pixels = readPGM(inputPath)
+        histogram = createHistogram(pixels, maxGrayLevel)
+        writeTable(outputPath, {'grayLevel': np.arange(len(histogram)), 'count': histogram})
+    elif command == 'moments':
+        width, height, maxGrayLevel, pixels = readPGM(inputPath)
+        table = featureTable(pixels, options['minArea'], options['background'], options['connectivity'])
+        writeTable(outputPath, table)
+
+def runJob(command, inputPath, outputPath, options, knownDigest=None):
+    """
+    Run one job in worker process. With known digest the content hash is
+    computed here so hashing is spread over the pool too, and the job is
+    skipped if output exists and hash did not change.
+
+    Parameters:
+    command(str): Name of command.
+    inputPath(str): A path to input file.
+    outputPath(str): A path of output file.
+    options(dict): Options of command.
+    knownDigest(str): Digest of the last run, '' to hash without skipping, or None to not hash.
+
+    Returns:
+    digest(str): Digest of inputs or None.
+    skipped(bool): True if output was up to date.
+    """
+
+    digest = None
+    if knownDigest is not None:
+        digest = contentDigest(command, options, [inputPath] + dependencies(command, options))
+        if digest == knownDigest and os.path.exists(outputPath):
+            return digest, True
+
+    os.makedirs(os.path.dirname(outputPath) or os.curdir, exist_ok=True)
+    # write to temporary file first so an interrupted job never looks up to date
+    temporaryPath = outputPath + '.part'
+    try:
+        process(command, inputPath, temporaryPath, options)
+        os.replace(temporaryPath, outputPath)
+    finally:
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+    return digest, False
+
+def runBatch(command, inputs, outputDirectory, options, processes=None, inFlight=None,
+             check='mtime', force=False):
+    """
+    Process many files with pool of worker processes. The interpreter and the
+    modules are loaded once per worker, not once per file. At most inFlight jobs
+    are submitted at once so memory does not grow with number of files.
+
+    Parameters:
+    command(str): Name of command, one of OUTPUTS.
+    inputs(list): Paths of input files or (inputPath, relativePath) of findInputs,
+    plain path is relative to its own directory.
+    outputDirectory(str): Directory of output files.
+    options(dict): Options of command.
+    processes(int): Number of worker processes or None for number of cpus.
+    inFlight(int): Max number of jobs submitted at once or None for 2 per process.
+    check(str): 'mtime' to skip outputs newer than their inputs, 'hash' to skip
+    outputs whose inputs have the same content hash as the last run.
+    force(bool): True to process every file.
+
+    Returns:
+    done(int): Number of processed files.
+    skipped(int): Number of files that were up to date.
+    failed(list): List of (inputPath, message) of failed files.
+
+    Raise:
+    ValueError: If command or check is unknown or two inputs have the same output.
+    """
+
+    if command not in OUTPUTS:
+        raise ValueError("command must be one of " + ", ".join(OUTPUTS))
+    if check not in ('mtime', 'hash'):
+        raise ValueError("check must be 'mtime' or 'hash'")
+
+    jobPaths = []
+    outputs = {}
+    for item in inputs:
+        inputPath, relativePath = (item, os.path.basename(item)) if isinstance(item, str) else item
+        path = outputPath(command, relativePath, outputDirectory)
+        if path in outputs:
+            raise ValueError(f"{outputs[path]} and {inputPath} have the same output {path}")
+        outputs[path] = inputPath
+        jobPaths.append((inputPath, path))
+
+    os.makedirs(outputDirectory, exist_ok=True)
+    manifestPath = os.path.join(outputDirectory, MANIFEST)
+    manifest = {}
+    if check == 'hash' and os.path.exists(manifestPath):
+        with open(manifestPath) as file:
+            manifest = json.load(file)
+
+    processes = processes or os.cpu_count() or 1
+    inFlight = max(1, inFlight or 2 * processes)
+    done = skipped = 0
+    failed = []
+
+    def jobs():
+        nonlocal skipped
+        for inputPath, path in jobPaths:
+            if check == 'mtime':
+                if not force and isNewer(path, [inputPath] + dependencies(command, options)):
+                    skipped += 1
+                    continue
+                yield inputPath, path, None
+            else:
+                yield inputPath, path, '' if force else manifest.get(path, '')
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = {}
+        queue = jobs()
+        while True:
+            for inputPath, path, knownDigest in queue:
+                future = executor.submit(runJob, command, inputPath, path, options, knownDigest)
+                pending[future] = (inputPath, path)
+                if len(pending) >= inFlight:
+                    break
+            if not pending:
+                break
+
+            finished, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                inputPath, path = pending.pop(future)
+                try:
+                    digest, isSkipped = future.result()
+                except Exception as error:
+                    failed.append((inputPath, str(error)))
+                    manifest.pop(path, None)
+                    continue
+                if digest is not None:
+                    manifest[path] = digest
+                if isSkipped:
+                    skipped += 1
+                else:
+                    done += 1
+
+    if check == 'hash':
+        with open(manifestPath + '.part', 'w') as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(manifestPath + '.part', manifestPath)
+
+    return done, skipped, failed
+
+def parseArguments(arguments=None):
+    """
+    Parse command line arguments.
+
+    Parameter:
+    arguments(list): Arguments or None for sys.argv.
+
+    Return:
+    namespace(argparse.Namespace): Parsed arguments.
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m BatchRun',
+                                     description='Process many pgm or ppm files with a pool of worker processes.')
+    parser.add_argument('command', choices=OUTPUTS)
+    parser.add_argument('patterns', nargs='+', help='glob patterns of input files, ** is recursive')
+    parser.add_argument('-o', '--out', default='out', help='directory of output files')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--in-flight', type=int, default=None, help='max number of jobs submitted at once')
+    parser.add_argument('--check', choices=('mtime', 'hash'), default='mtime',
+                        help='how to find outputs that are up to date')
+    parser.add_argument('--force', action='store_true', help='process files that are up to date too')
+    parser.add_argument('--map', help='warp map of saveWarpMap (warp)')
+    parser.add_argument('--interpolation', choices=INTERPOLATIONS, default='bilinear')
+    parser.add_argument('--border', choices=BORDERS, default='replicate')
+    parser.add_argument('--border-value', type=float, default=0)
+    parser.add_argument('--expression', default='p',
+                        help='expression of p for gray or r, g, b for color images (algebra)')
+    parser.add_argument('--max-gray-level', type=int, default=None,
+                        help='max gray level of output or None for that of input (algebra)')
+    parser.add_argument('--min-area', type=int, default=1, help='min area of object (moments)')
+    parser.add_argument('--background', type=int, default=None, help='gray level of background (moments)')
+    parser.add_argument('--connectivity', type=int, choices=(4, 8), default=None,
+                        help='label connected components first (moments)')
+    namespace = parser.parse_args(arguments)
+    if namespace.command == 'warp' and namespace.map is None:
+        parser.error('warp needs --map')
+    return namespace
+
+def main(arguments=None):
+    namespace = parseArguments(arguments)
+    options = {}
+    if namespace.command == 'warp':
+        options = {'map': namespace.map, 'interpolation': namespace.interpolation,
+                   'border': namespace.border, 'borderValue': namespace.border_value}
+    elif namespace.command == 'algebra':
+        options = {'expression': namespace.expression, 'maxGrayLevel': namespace.max_gray_level}
+    elif namespace.command == 'moments':
+        options = {'minArea': namespace.min_area, 'background': namespace.background,
+                   'connectivity': namespace.connectivity}
+
+    try:
+        inputs = findInputs(namespace.patterns, namespace.out)
+        done, skipped, failed = runBatch(namespace.command, inputs, namespace.out, options,
+                                         namespace.processes, namespace.in_flight, namespace.check,
+                                         namespace.force)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    for inputPath, message in failed:
+        print(f"{inputPath}: {message}", file=sys.stderr)
+    print(f"{done} processed, {skipped} up to date, {len(failed)} failed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
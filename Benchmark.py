@@ -0,0 +1,315 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from AlgebraicOP import combineLists, excessGreen
+from GeometricOP import coordinateMaps, remap, solveCells, spatialTranform
+from Histogram import createHistogram
+from ImageIO import pixelType, readPGM, writePixelsToPGM
+from ObjectMoment import accumulateMoments, featureTable
+from PointOP import mapColor, pointOperate
+
+SIZES = (256, 1024, 4096, 16384)
+BITS = (8, 16)
+
+# number of cells of each side of synthetic warp mesh
+MESH_CELLS = 16
+
+def syntheticImage(shape, maxGrayLevel, seed=0):
+    """
+    Return random image with every gray level from 0 to max gray level.
+
+    Parameters:
+    shape(tuple): Shape of image.
+    maxGrayLevel(int): Max value of gray scale.
+    seed(int): Seed of random generator so runs on different commits see the same image.
+
+    Return:
+    pixels(np.ndarray): Random pixels of native dtype of max gray level.
+    """
+
+    dtype = pixelType(maxGrayLevel).newbyteorder('=')
+    return np.random.default_rng(seed).integers(0, maxGrayLevel + 1, shape, dtype=dtype)
+
+def syntheticMesh(size):
+    """
+    Return control points of regular mesh over image and of the same mesh
+    displaced by smooth swirl, corners and border stay fixed.
+
+    Parameter:
+    size(int): Height and width of image.
+
+    Returns:
+    gridPoints(np.ndarray): Array (rows, cols, 2) of regular control points.
+    distPoints(np.ndarray): Array (rows, cols, 2) of displaced control points.
+    """
+
+    line = np.linspace(0, size - 1, MESH_CELLS + 1)
+    gridPoints = np.stack(np.meshgrid(line, line, indexing='ij'), axis=-1)
+    phase = np.sin(np.pi * gridPoints / (size - 1))
+    bump = phase[..., 0] * phase[..., 1] * size / (4 * MESH_CELLS)
+    distPoints = gridPoints + np.stack([bump, -bump], axis=-1)
+    return gridPoints, distPoints
+
+def prepareReadPGM(size, maxGrayLevel, directory):
+    filePath = os.path.join(directory, 'read.pgm')
+    writePixelsToPGM(filePath, size, size, maxGrayLevel, syntheticImage((size, size), maxGrayLevel))
+    # readPGM only maps the file, copying it reads every pixel
+    return lambda: np.array(readPGM(filePath)[3])
+
+def prepareWritePixelsToPGM(size, maxGrayLevel, directory):
+    filePath = os.path.join(directory, 'write.pgm')
+    pixels = syntheticImage((size, size), maxGrayLevel)
+    return lambda: writePixelsToPGM(filePath, size, size, maxGrayLevel, pixels)
+
+def prepareCreateHistogram(size, maxGrayLevel, directory):
+    pixels = syntheticImage((size, size), maxGrayLevel)
+    return lambda: createHistogram(pixels, maxGrayLevel)
+
+def preparePointOperate(size, maxGrayLevel, directory):
+    pixels = syntheticImage((size, size), maxGrayLevel)
+    histogram = createHistogram(pixels, maxGrayLevel)
+    # mapColor works in place, every run equalizes a fresh copy of the same image
+    buffer = np.empty_like(pixels)
+
+    def run():
+        buffer[...] = pixels
+        outputHistogram, equalization = pointOperate(histogram, size, size, maxGrayLevel)
+        mapColor(buffer, size, size, equalization)
+    return run
+
+def prepareCombineLists(size, maxGrayLevel, directory):
+    pixelsA = syntheticImage((size, size), maxGrayLevel, 1)
+    pixelsB = syntheticImage((size, size), maxGrayLevel, 2)
+    return lambda: combineLists(pixelsA, '-', pixelsB, maxGrayLevel)
+
+def prepareExcessGreen(size, maxGrayLevel, directory):
+    # channels are strided views of interleaved rgb pixels as readChannels returns them
+    pixels = syntheticImage((size, size, 3), maxGrayLevel)
+    channels = {'r': pixels[..., 0], 'g': pixels[..., 1], 'b': pixels[..., 2]}
+    return lambda: excessGreen(2, channels)
+
+def prepareAccumulateMoments(size, maxGrayLevel, directory):
+    # every gray level is a label, so 16 bit images have 256 times as many objects
+    labels = syntheticImage((size, size), maxGrayLevel)
+    return lambda: accumulateMoments(labels, 3)
+
+def prepareFeatureTable(size, maxGrayLevel, directory):
+    labels = syntheticImage((size, size), maxGrayLevel)
+    return lambda: featureTable(labels)
+
+def prepareCoordinateMaps(size, maxGrayLevel, directory):
+    gridPoints, distPoints = syntheticMesh(size)
+    coefficients = solveCells(gridPoints, distPoints)
+    return lambda: coordinateMaps(gridPoints, coefficients, size, size)
+
+def prepareSpatialTranform(size, maxGrayLevel, directory):
+    # control points as dicts of whole pixels, one call per cell as the demo main of GeometricOP did
+    gridPoints, distPoints = syntheticMesh(size)
+    grid = np.array([[{'x': int(x), 'y': int(y)} for x, y in row] for row in np.rint(gridPoints)])
+    distGrid = np.array([[{'x': x, 'y': y} for x, y in row] for row in distPoints])
+    cells = [[(x, y), (x, y + 1), (x + 1, y), (x + 1, y + 1)]
+             for x in range(MESH_CELLS) for y in range(MESH_CELLS)]
+    return lambda: [spatialTranform(grid, distGrid, refPoint) for refPoint in cells]
+
+def prepareRemap(size, maxGrayLevel, directory):
+    pixels = syntheticImage((size, size), maxGrayLevel)
+    gridPoints, distPoints = syntheticMesh(size)
+    mapX, mapY = coordinateMaps(gridPoints, solveCells(gridPoints, distPoints), size, size)
+    out = np.empty_like(pixels)
+    return lambda: remap(pixels, mapX, mapY, maxGrayLevel=maxGrayLevel, out=out)
+
+# operators whose work does not depend on bit depth of pixels, they run once per size
+BIT_INDEPENDENT = {'spatialTranform', 'coordinateMaps'}
+
+# function that builds input of each operator and returns function to time
+OPERATORS = {
+    'readPGM': prepareReadPGM,
+    'writePixelsToPGM': prepareWritePixelsToPGM,
+    'createHistogram': prepareCreateHistogram,
+    'pointOperate+mapColor': preparePointOperate,
+    'combineLists': prepareCombineLists,
+    'excessGreen': prepareExcessGreen,
+    'accumulateMoments': prepareAccumulateMoments,
+    'featureTable': prepareFeatureTable,
+    'spatialTranform': prepareSpatialTranform,
+    'coordinateMaps': prepareCoordinateMaps,
+    'remap': prepareRemap,
+}
+
+def peakRSS():
+    """
+    Return peak resident set size of this process in bytes.
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(operator, size, bits, repeat):
+    """
+    Time one operator on one image size and bit depth. It runs in its own process
+    so peak RSS belongs to this case only. Allocations are traced in one extra
+    run after timing because tracing slows numpy down.
+
+    Parameters:
+    operator(str): Name of operator, one of OPERATORS.
+    size(int): Height and width of image.
+    bits(int): 8 or 16 bits per pixel.
+    repeat(int): Number of timed runs.
+
+    Return:
+    result(dict): Result of case.
+    """
+
+    maxGrayLevel = (1 << bits) - 1
+    with tempfile.TemporaryDirectory() as directory:
+        run = OPERATORS[operator](size, maxGrayLevel, directory)
+        setupRSS = peakRSS()
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        runRSS = peakRSS()
+
+        tracemalloc.start()
+        run()
+        allocated, allocationPeak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best = min(times)
+    return {
+        'operator': operator,
+        'size': size,
+        'bits': bits,
+        'pixels': size * size,
+        'times': times,
+        'seconds': best,
+        'mpixPerSecond': size * size / 1e6 / best if best > 0 else None,
+        'setupRSS': setupRSS,
+        'peakRSS': runRSS,
+        'allocationPeak': allocationPeak,
+        'allocationRetained': allocated,
+    }
+
+def machine():
+    """
+    Return description of machine and commit that results were measured on.
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+def runBenchmark(operators=None, sizes=SIZES, bits=BITS, repeat=3):
+    """
+    Run every operator on every image size and bit depth, each case in a fresh process.
+    A case that fails, e.g. runs out of memory, is recorded with its error.
+    Operators in BIT_INDEPENDENT run once per size and their bits is None.
+
+    Parameters:
+    operators(list): Names of operators or None for every operator.
+    sizes(list): Height and width of images.
+    bits(list): Bits per pixel, 8 or 16.
+    repeat(int): Number of timed runs of each case.
+
+    Return:
+    report(dict): 'machine' and list of 'results'.
+
+    Raise:
+    ValueError: If an operator is unknown.
+    """
+
+    operators = list(OPERATORS) if operators is None else list(operators)
+    unknown = set(operators) - OPERATORS.keys()
+    if unknown:
+        raise ValueError(f"Unknown operator {', '.join(sorted(unknown))}")
+
+    results = []
+    for operator in operators:
+        for size in sizes:
+            for bit in bits[:1] if operator in BIT_INDEPENDENT else bits:
+                with concurrent.futures.ProcessPoolExecutor(1) as executor:
+                    try:
+                        result = executor.submit(measure, operator, size, bit, repeat).result()
+                    except Exception as error:
+                        result = {'operator': operator, 'size': size, 'bits': bit,
+                                  'error': f"{type(error).__name__}: {error}"}
+                if operator in BIT_INDEPENDENT:
+                    result['bits'] = None
+                results.append(result)
+                print(formatResult(result), flush=True)
+
+    return {'machine': machine(), 'results': results}
+
+def formatResult(result, baseline=None):
+    """
+    Return one line of text of result and of ratio to baseline result.
+    """
+
+    bits = '-' if result['bits'] is None else result['bits']
+    case = f"{result['operator']:<22} {result['size']:>6}^2 {bits:>2} bit"
+    if 'error' in result:
+        return f"{case}  {result['error']}"
+    line = (f"{case} {result['mpixPerSecond']:>10.1f} MPix/s {result['peakRSS'] / 2**20:>9.1f} MiB RSS"
+            f" {result['allocationPeak'] / 2**20:>9.1f} MiB allocated")
+    if baseline is not None and baseline.get('mpixPerSecond'):
+        line += f" {result['mpixPerSecond'] / baseline['mpixPerSecond']:>6.2f}x"
+    return line
+
+def compareReports(report, baselineReport):
+    """
+    Print each result with its speed ratio to the same case of baseline report.
+
+    Parameters:
+    report(dict): Report of runBenchmark.
+    baselineReport(dict): Report of runBenchmark of another commit on the same machine.
+    """
+
+    baselines = {(result['operator'], result['size'], result['bits']): result
+                 for result in baselineReport['results']}
+    for result in report['results']:
+        print(formatResult(result, baselines.get((result['operator'], result['size'], result['bits']))))
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m Benchmark',
+                                     description='Measure throughput and memory of operators.')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='path of json report')
+    parser.add_argument('--operators', nargs='+', choices=OPERATORS, default=None)
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--bits', nargs='+', type=int, choices=BITS, default=BITS)
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs of each case')
+    parser.add_argument('--compare', help='json report of another commit to compare with')
+    namespace = parser.parse_args(arguments)
+
+    report = runBenchmark(namespace.operators, namespace.sizes, namespace.bits, namespace.repeat)
+    with open(namespace.output, 'w') as file:
+        json.dump(report, file, indent=1)
+
+    if namespace.compare:
+        with open(namespace.compare) as file:
+            compareReports(report, json.load(file))
+
+if __name__ == "__main__":
+    main()
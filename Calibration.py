@@ -0,0 +1,245 @@
+import numpy as np
+
+from Labeling import labelComponents
+
+def darkMask(pixels, threshold=None):
+    """
+    Return mask of dark (line) pixels of calibration grid image.
+
+    Parameters:
+    pixels(np.ndarray): 2D pixels of grid image.
+    threshold(int): Pixels less than threshold are dark or None for max of pixels,
+    so every pixel that is not background is dark, faint resampled line pixels too.
+
+    Return:
+    mask(np.ndarray): 2D boolean mask of dark pixels.
+    """
+
+    pixels = np.asarray(pixels)
+    if threshold is None:
+        threshold = pixels.max()
+    return pixels < threshold
+
+def windowLabels(labels, points, radius):
+    """
+    Gather labels of square window around every point, outside of image is 0.
+
+    Parameters:
+    labels(np.ndarray): 2D labels of cells.
+    points(tuple): (x, y) arrays of points.
+    radius(int): Half size of window.
+
+    Return:
+    windows(np.ndarray): Array (n, (2*radius+1)**2) of labels around each point.
+    """
+
+    padded = np.pad(labels, radius)
+    offsets = np.arange(-radius, radius + 1)
+    x = points[0][:, None, None] + offsets[:, None] + radius
+    y = points[1][:, None, None] + offsets[None, :] + radius
+    return padded[x, y].reshape(len(points[0]), -1)
+
+def cellTable(labels, count, radius=1):
+    """
+    Find row and column of every cell of grid from the order of cells along the
+    top and left border and from neighbours of cells across one line.
+    Cell (row, col) is the only common neighbour of (row-1, col) and (row, col-1)
+    except (row-1, col-1), so distortion can bend lines in any direction.
+
+    Parameters:
+    labels(np.ndarray): 2D labels of cells, 0 for lines.
+    count(int): Number of cells.
+    radius(int): Half size of window around line pixels.
+
+    Returns:
+    cellRow(np.ndarray): Row of each label, index 0 is unused.
+    cellCol(np.ndarray): Column of each label, index 0 is unused.
+
+    Raise:
+    ValueError: If cells do not form a regular grid.
+    """
+
+    def borderOrder(line):
+        line = line[line > 0]
+        first = np.unique(line, return_index=True)[1]
+        return line[np.sort(first)]
+
+    # cells are neighbours if the window of a line pixel has exactly two cells
+    windows = np.sort(windowLabels(labels, np.nonzero(labels == 0), radius), axis=1)
+    zeros = (windows == 0).sum(axis=1)
+    distinct = (np.diff(windows, axis=1) > 0).sum(axis=1)
+    index = np.nonzero((distinct == 2) & (zeros > 0))[0]
+    pairs = np.unique(np.stack([windows[index, zeros[index]], windows[index, -1]], axis=1), axis=0)
+    neighbours = [set() for _ in range(count + 1)]
+    for a, b in pairs:
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+
+    top = borderOrder(labels[0])
+    left = borderOrder(labels[:, 0])
+    if len(top) == 0 or top[0] != left[0]:
+        raise ValueError("grid cells cannot be matched")
+
+    table = np.zeros((len(left), len(top)), dtype=np.int64)
+    table[0] = top
+    table[:, 0] = left
+    for row in range(1, len(left)):
+        for col in range(1, len(top)):
+            candidates = neighbours[table[row - 1, col]] & neighbours[table[row, col - 1]]
+            candidates.discard(table[row - 1, col - 1])
+            if len(candidates) != 1:
+                raise ValueError("grid cells cannot be matched")
+            table[row, col] = candidates.pop()
+
+    if len(np.unique(table)) != count:
+        raise ValueError("grid cells cannot be matched")
+
+    cellRow = np.zeros(count + 1, dtype=np.int64)
+    cellCol = np.zeros(count + 1, dtype=np.int64)
+    cellRow[table] = np.arange(len(left))[:, None]
+    cellCol[table] = np.arange(len(top))[None, :]
+    return cellRow, cellCol
+
+def pointOfPixels(labels, cellRow, cellCol, x, y, radius):
+    """
+    Find control point that each line pixel belongs to from cells in its window.
+    Line pixel belongs to intersection (row, col) if its window touches all four
+    cells (row-1..row, col-1..col), and to the point where a line meets the border
+    if it is on the border and its window touches the two cells beside the line.
+
+    Parameters:
+    labels(np.ndarray): 2D labels of cells, 0 for lines.
+    cellRow(np.ndarray): Row of each label.
+    cellCol(np.ndarray): Column of each label.
+    x(np.ndarray): x of line pixels.
+    y(np.ndarray): y of line pixels.
+    radius(int): Half size of window around line pixels.
+
+    Returns:
+    pointRow(np.ndarray): Row of control point of each pixel or -1.
+    pointCol(np.ndarray): Column of control point of each pixel or -1.
+    """
+
+    height, width = labels.shape
+    rows = cellRow.max() + 1
+    cols = cellCol.max() + 1
+    windows = windowLabels(labels, (x, y), radius)
+    inside = windows > 0
+    windowRow = np.where(inside, cellRow[windows], rows)
+    windowCol = np.where(inside, cellCol[windows], cols)
+    minRow = windowRow.min(axis=1)
+    minCol = windowCol.min(axis=1)
+    maxRow = np.where(inside, windowRow, -1).max(axis=1)
+    maxCol = np.where(inside, windowCol, -1).max(axis=1)
+    # bit of each cell of 2x2 block from (minRow, minCol) that is in window
+    block = np.clip(2 * (windowRow - minRow[:, None]) + windowCol - minCol[:, None], 0, 4)
+    present = np.bitwise_or.reduce(np.where(inside, 1 << block, 0), axis=1)
+
+    pointRow = np.full(len(x), -1)
+    pointCol = np.full(len(x), -1)
+    junction = (present == 15) & (maxRow - minRow == 1) & (maxCol - minCol == 1)
+    pointRow[junction] = minRow[junction] + 1
+    pointCol[junction] = minCol[junction] + 1
+    across = (present == 3) & (maxRow == minRow) & (maxCol - minCol == 1)
+    for onBorder, row in ((x == 0, 0), (x == height - 1, rows)):
+        select = across & onBorder & (minRow == min(row, rows - 1))
+        pointRow[select] = row
+        pointCol[select] = minCol[select] + 1
+    along = (present == 5) & (maxCol == minCol) & (maxRow - minRow == 1)
+    for onBorder, col in ((y == 0, 0), (y == width - 1, cols)):
+        select = along & onBorder & (minCol == min(col, cols - 1))
+        pointRow[select] = minRow[select] + 1
+        pointCol[select] = col
+
+    return pointRow, pointCol
+
+def detectControlPoints(pixels, radius=2, threshold=None, minArea=None):
+    """
+    Find control points of grid image without knowing where lines are.
+    White cells between lines are labelled and small white holes inside thick
+    lines are dropped, then line pixels are assigned to control points by
+    pointOfPixels. Control point is the centroid of its pixels.
+    Where distorted lines are thick or run together for a while no window
+    touches all four cells, so window of missing points grows until they are
+    found or window is as large as half of a cell. Corners of image are fixed.
+
+    Parameters:
+    pixels(np.ndarray): 2D pixels of grid image, dark lines on bright background.
+    radius(int): Half size of the first window around line pixels.
+    threshold(int): Threshold of dark pixels or None for automatic threshold.
+    minArea(int): Minimum area of cell or None for a quarter of median area of cells.
+
+    Return:
+    points(np.ndarray): Array (rows+1, cols+1, 2) of (x, y) of control points
+    where rows and cols are number of cells.
+
+    Raise:
+    ValueError: If cells do not form a regular grid or a control point is not found.
+    """
+
+    mask = darkMask(pixels, threshold)
+    height, width = mask.shape
+    labels, count = labelComponents(mask, connectivity=4, background=1)
+    areas = np.bincount(labels.ravel(), minlength=count + 1)
+    if minArea is None:
+        minArea = np.median(areas[1:]) / 4 if count else 0
+    keep = areas >= minArea
+    keep[0] = False
+    lookUpTable = np.where(keep, np.cumsum(keep), 0)
+    labels = lookUpTable[labels]
+    count = int(keep.sum())
+    cellRow, cellCol = cellTable(labels, count, radius)
+    rows = cellRow.max() + 1
+    cols = cellCol.max() + 1
+
+    size = (rows + 1) * (cols + 1)
+    number = np.zeros(size, dtype=np.int64)
+    number[[0, cols, rows * (cols + 1), size - 1]] = 1
+    points = np.zeros((size, 2))
+    points[[0, cols, rows * (cols + 1), size - 1]] = [(0, 0), (0, width - 1), (height - 1, 0), (height - 1, width - 1)]
+
+    x, y = np.nonzero(labels == 0)
+    maxRadius = max(radius, int(np.sqrt(np.median(areas[keep]))) // 2)
+    while radius <= maxRadius and (number == 0).any():
+        pointRow, pointCol = pointOfPixels(labels, cellRow, cellCol, x, y, radius)
+        found = pointRow >= 0
+        index = pointRow[found] * (cols + 1) + pointCol[found]
+        missing = number == 0
+        found[found] = missing[index]
+        index = index[missing[index]]
+        number += np.bincount(index, minlength=size)
+        points[:, 0] += np.bincount(index, weights=x[found], minlength=size)
+        points[:, 1] += np.bincount(index, weights=y[found], minlength=size)
+        radius += 1
+
+    if (number == 0).any():
+        raise ValueError("control point of grid not found")
+
+    return (points / number[:, None]).reshape(rows + 1, cols + 1, 2)
+
+def detectGrid(pixelsGrid, pixelsDistGrid, radius=2, threshold=None, minArea=None):
+    """
+    Find matching control points of calibration grid and of the same grid seen
+    through the distortion.
+
+    Parameters:
+    pixelsGrid(np.ndarray): 2D pixels of undistorted grid image.
+    pixelsDistGrid(np.ndarray): 2D pixels of distorted grid image.
+    radius(int): Half size of the first window around line pixels.
+    threshold(int): Threshold of dark pixels or None for automatic threshold.
+    minArea(int): Minimum area of cell or None for a quarter of median area of cells.
+
+    Returns:
+    gridPoints(np.ndarray): Array (rows, cols, 2) of (x, y) of control points of undistorted grid.
+    distPoints(np.ndarray): Array (rows, cols, 2) of (x, y) of control points of distorted grid.
+
+    Raise:
+    ValueError: If control points are not found or grids have different number of cells.
+    """
+
+    gridPoints = detectControlPoints(pixelsGrid, radius, threshold, minArea)
+    distPoints = detectControlPoints(pixelsDistGrid, radius, threshold, minArea)
+    if gridPoints.shape != distPoints.shape:
+        raise ValueError("grid and distorted grid have different number of cells")
+
+    return gridPoints, distPoints
@@ -1,209 +1,917 @@
+import os
+import weakref
+
 import numpy as np
 
-def readPGM(filePath):
+from Calibration import detectGrid
+from ImageIO import readPGM, writePixelsToPGM
+
+# number of output pixels of one block of coordinate map or resampling
+TILE_PIXELS = 1 << 16
+
+INTERPOLATIONS = ('nearest', 'bilinear', 'bicubic')
+BORDERS = ('constant', 'replicate', 'reflect')
+
+# max distance in pixels between output pixel and forward mapping of its inverse
+INVERSE_TOLERANCE = 1e-2
+
+def pointsToArray(points):
+    """
+    Convert 2D list (or object array) of {'x': .., 'y': ..} control points to array.
+    
+    Parameter:
+    points(list): 2D list of control points.
+    
+    Return:
+    points(np.ndarray): Array (rows, cols, 2) of (x, y) of control points.
+    """
+    
+    return np.array([[(point['x'], point['y']) for point in row] for row in points], dtype=np.float64)
+
+def solveCells(gridPoints, distPoints):
+    """
+    Solve bilinear mapping x' = a0*x + a1*y + a2*x*y + a3 (and the same for y')
+    of every cell of control point grid in one batched np.linalg.solve.
+    
+    Parameters:
+    gridPoints(np.ndarray): Array (rows, cols, 2) of control points of output (grid).
+    distPoints(np.ndarray): Array (rows, cols, 2) of control points of input (distorted grid).
+    
+    Return:
+    coefficients(np.ndarray): Array (rows-1, cols-1, 4, 2) of (a0, a1, a2, a3) of x' and y' of each cell.
+    """
+    
+    def corners(points):
+        return np.stack([points[:-1, :-1], points[:-1, 1:], points[1:, :-1], points[1:, 1:]], axis=2)
+    
+    source = corners(np.asarray(gridPoints, dtype=np.float64))
+    x = source[..., 0]
+    y = source[..., 1]
+    xy = np.stack([x, y, x * y, np.ones_like(x)], axis=-1)
+    
+    return np.linalg.solve(xy, corners(np.asarray(distPoints, dtype=np.float64)))
+
+def cellIndex(edges, positions):
+    """
+    Find cell of each position from edges of cells, position on an edge belongs to the next cell.
+    
+    Parameters:
+    edges(np.ndarray): Increasing positions of control points.
+    positions(np.ndarray): Positions to find cell.
+    
+    Return:
+    cells(np.ndarray): Cell index of each position.
+    """
+    
+    return np.clip(np.searchsorted(edges, positions, side='right') - 1, 0, len(edges) - 2)
+
+def coordinateMaps(gridPoints, coefficients, height, width, rows=None):
+    """
+    Compute input coordinate (x', y') of every output pixel from coefficients of cells.
+    Output pixels are processed in blocks of rows with broadcasting.
+    
+    Parameters:
+    gridPoints(np.ndarray): Array (rows, cols, 2) of control points of output (grid).
+    coefficients(np.ndarray): Array (rows-1, cols-1, 4, 2) from solveCells.
+    height(int): Height of output image.
+    width(int): Width of output image.
+    rows(tuple): (start, stop) of output rows to compute or None for all rows.
+    
+    Returns:
+    mapX(np.ndarray): float32 array (rows, width) of x' of each output pixel.
+    mapY(np.ndarray): float32 array (rows, width) of y' of each output pixel.
+    """
+    
+    start, stop = rows if rows is not None else (0, height)
+    gridPoints = np.asarray(gridPoints, dtype=np.float64)
+    mapX = np.empty((stop - start, width), dtype=np.float32)
+    mapY = np.empty((stop - start, width), dtype=np.float32)
+    y = np.arange(width, dtype=np.float64)
+    cellCol = cellIndex(gridPoints[0, :, 1], y)
+    step = max(1, TILE_PIXELS // max(1, width))
+    
+    for blockStart in range(start, stop, step):
+        x = np.arange(blockStart, min(blockStart + step, stop), dtype=np.float64)
+        cellRow = cellIndex(gridPoints[:, 0, 0], x)
+        coefficient = coefficients[cellRow[:, None], cellCol[None, :]]
+        X = x[:, None, None]
+        Y = y[None, :, None]
+        mapped = (coefficient[..., 0, :] * X + coefficient[..., 1, :] * Y
+                  + coefficient[..., 2, :] * (X * Y) + coefficient[..., 3, :])
+        mapX[blockStart - start:blockStart - start + len(x)] = mapped[..., 0]
+        mapY[blockStart - start:blockStart - start + len(x)] = mapped[..., 1]
+    
+    return mapX, mapY
+
+def invertBilinear(coefficient, x, y, center):
+    """
+    Solve a0*u + a1*v + a2*u*v + a3 = x and b0*u + b1*v + b2*u*v + b3 = y for (u, v)
+    in closed form. With vectors e = (a0, b0), f = (a1, b1), g = (a2, b2) and
+    h = (x - a3, y - b3), crossing h = u*e + v*f + u*v*g with e + v*g leaves
+    quadratic cross(g, f)*v^2 + (cross(e, f) + cross(h, g))*v + cross(h, e) = 0,
+    then u comes from the better conditioned of the two equations.
+    Root that solves the equations and is nearer to center is taken.
+    
+    Parameters:
+    coefficient(np.ndarray): Array (..., 4, 2) of (a0..a3, b0..b3) of each point.
+    x(np.ndarray): x of each point.
+    y(np.ndarray): y of each point.
+    center(np.ndarray): Array (..., 2) of (u, v) near the wanted root of each point.
+    
+    Returns:
+    u(np.ndarray): u of each point.
+    v(np.ndarray): v of each point.
+    """
+    
+    def cross(ax, ay, bx, by):
+        return ax * by - ay * bx
+    
+    ex, fx, gx, a3 = np.moveaxis(coefficient[..., 0], -1, 0)
+    ey, fy, gy, b3 = np.moveaxis(coefficient[..., 1], -1, 0)
+    hx = x - a3
+    hy = y - b3
+    k2 = cross(gx, gy, fx, fy)
+    k1 = cross(ex, ey, fx, fy) + cross(hx, hy, gx, gy)
+    k0 = cross(hx, hy, ex, ey)
+    
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # stable roots, the second one is -k0/k1 when k2 is 0
+        root = np.sqrt(np.maximum(k1 * k1 - 4 * k2 * k0, 0))
+        half = -(k1 + np.where(k1 < 0, -root, root)) / 2
+        u = v = best = None
+        for candidateV in (k0 / half, half / k2):
+            denominatorX = ex + gx * candidateV
+            denominatorY = ey + gy * candidateV
+            candidateU = np.where(np.abs(denominatorX) >= np.abs(denominatorY),
+                                  (hx - fx * candidateV) / denominatorX, (hy - fy * candidateV) / denominatorY)
+            residual = (np.abs(ex * candidateU + fx * candidateV + gx * candidateU * candidateV - hx)
+                        + np.abs(ey * candidateU + fy * candidateV + gy * candidateU * candidateV - hy))
+            distance = (candidateU - center[..., 0]) ** 2 + (candidateV - center[..., 1]) ** 2
+            # solutions first, then the nearest to center
+            score = np.where(residual <= 1e-6 * (1 + np.abs(hx) + np.abs(hy)), distance, np.inf)
+            score = np.where(np.isfinite(candidateU) & np.isfinite(candidateV), score, np.nan)
+            if best is None:
+                u, v, best = candidateU, candidateV, score
+                continue
+            better = (score < best) | np.isnan(best)
+            u = np.where(better, candidateU, u)
+            v = np.where(better, candidateV, v)
+            best = np.where(better, score, best)
+    
+    return u, v
+
+def inverseCoordinateMaps(gridPoints, distPoints, height, width, rows=None):
+    """
+    Compute input coordinate of every output pixel by inverting the forward
+    bilinear mapping of each cell from distorted grid to grid, the mapping that
+    splatting uses. Each output pixel is solved once in closed form so every
+    output pixel is written exactly once with no holes and no collisions.
+    Where the mapping of a strongly distorted cell folds and a pixel has no real
+    solution, the root does not map back to the pixel within INVERSE_TOLERANCE,
+    so the input coordinate of forward mapping from grid to distorted grid
+    (coordinateMaps) is used for that pixel instead.
+    Output pixels are processed in blocks of rows with broadcasting.
+    
+    Parameters:
+    gridPoints(np.ndarray): Array (rows, cols, 2) of control points of output (grid).
+    distPoints(np.ndarray): Array (rows, cols, 2) of control points of input (distorted grid).
+    height(int): Height of output image.
+    width(int): Width of output image.
+    rows(tuple): (start, stop) of output rows to compute or None for all rows.
+    
+    Returns:
+    mapX(np.ndarray): float32 array (rows, width) of x' of each output pixel.
+    mapY(np.ndarray): float32 array (rows, width) of y' of each output pixel.
+    """
+    
+    start, stop = rows if rows is not None else (0, height)
+    gridPoints = np.asarray(gridPoints, dtype=np.float64)
+    distPoints = np.asarray(distPoints, dtype=np.float64)
+    coefficients = solveCells(distPoints, gridPoints)
+    forwardCoefficients = solveCells(gridPoints, distPoints)
+    centers = (distPoints[:-1, :-1] + distPoints[:-1, 1:] + distPoints[1:, :-1] + distPoints[1:, 1:]) / 4
+    mapX = np.empty((stop - start, width), dtype=np.float32)
+    mapY = np.empty((stop - start, width), dtype=np.float32)
+    y = np.arange(width, dtype=np.float64)
+    cellCol = cellIndex(gridPoints[0, :, 1], y)
+    step = max(1, TILE_PIXELS // max(1, width))
+    
+    for blockStart in range(start, stop, step):
+        x = np.arange(blockStart, min(blockStart + step, stop), dtype=np.float64)
+        cellRow = cellIndex(gridPoints[:, 0, 0], x)
+        cells = (cellRow[:, None], cellCol[None, :])
+        coefficient = coefficients[cells]
+        X = x[:, None]
+        Y = y[None, :]
+        u, v = invertBilinear(coefficient, X, Y, centers[cells])
+        
+        # root of folded cell that does not map back to the pixel is replaced by forward mapping
+        with np.errstate(invalid='ignore', over='ignore'):
+            mapped = (coefficient[..., 0, :] * u[..., None] + coefficient[..., 1, :] * v[..., None]
+                      + coefficient[..., 2, :] * (u * v)[..., None] + coefficient[..., 3, :])
+            failed = ~(np.hypot(mapped[..., 0] - X, mapped[..., 1] - Y) <= INVERSE_TOLERANCE)
+        if failed.any():
+            forward = forwardCoefficients[cells]
+            mapped = (forward[..., 0, :] * X[..., None] + forward[..., 1, :] * Y[..., None]
+                      + forward[..., 2, :] * (X * Y)[..., None] + forward[..., 3, :])
+            u = np.where(failed, mapped[..., 0], u)
+            v = np.where(failed, mapped[..., 1], v)
+        mapX[blockStart - start:blockStart - start + len(x)] = u
+        mapY[blockStart - start:blockStart - start + len(x)] = v
+    
+    return mapX, mapY
+
+def spatialTranform(grid, distGrid, refPoint):
+    """
+    Compute input coordinate of every pixel of one cell of grid, including its edges.
+    
+    Parameters:
+    grid(np.ndarray): 2D array of {'x', 'y'} control points of output.
+    distGrid(np.ndarray): 2D array of {'x', 'y'} control points of input.
+    refPoint(list): Index of up-left, up-right, down-left and down-right corners of cell.
+    
+    Return:
+    inputCoor(np.ndarray): Array (rows, cols, 2) of (x', y') of each pixel of cell.
+    """
+    
+    gridPoints = np.array([[grid[refPoint[0]]['x'], grid[refPoint[0]]['y']],
+                           [grid[refPoint[3]]['x'], grid[refPoint[3]]['y']]], dtype=np.float64)
+    gridCorners = np.array([[gridPoints[0], [gridPoints[0, 0], gridPoints[1, 1]]],
+                            [[gridPoints[1, 0], gridPoints[0, 1]], gridPoints[1]]])
+    distCorners = np.array([[[distGrid[refPoint[0]]['x'], distGrid[refPoint[0]]['y']],
+                             [distGrid[refPoint[1]]['x'], distGrid[refPoint[1]]['y']]],
+                            [[distGrid[refPoint[2]]['x'], distGrid[refPoint[2]]['y']],
+                             [distGrid[refPoint[3]]['x'], distGrid[refPoint[3]]['y']]]], dtype=np.float64)
+    coefficient = solveCells(gridCorners, distCorners)[0, 0]
+    
+    x = np.arange(gridPoints[0, 0], gridPoints[1, 0] + 1)[:, None, None]
+    y = np.arange(gridPoints[0, 1], gridPoints[1, 1] + 1)[None, :, None]
+    
+    return coefficient[0] * x + coefficient[1] * y + coefficient[2] * x * y + coefficient[3]
+
+def thinPlateKernel(squaredDistance):
+    """
+    Radial basis U(r) = r^2 log(r^2) of thin-plate spline from squared distance, U(0) = 0.
+    
+    Parameter:
+    squaredDistance(np.ndarray): Squared distances.
+    
+    Return:
+    values(np.ndarray): Values of radial basis.
+    """
+    
+    # tiny floor keeps log finite, 0 * log(tiny) is 0
+    return squaredDistance * np.log(np.maximum(squaredDistance, np.finfo(np.float64).tiny))
+
+def fitThinPlateSpline(sourcePoints, targetPoints, regularization=0.0):
+    """
+    Fit thin-plate spline that maps scattered source points to target points,
+    points do not need to lie on a regular grid.
+    
+    Parameters:
+    sourcePoints(np.ndarray): Array (..., 2) of (x, y) of output control points.
+    targetPoints(np.ndarray): Array (..., 2) of (x', y') of input control points.
+    regularization(float): Smoothing, 0 to pass exactly through every point.
+    
+    Returns:
+    centers(np.ndarray): Array (n, 2) of source points.
+    coefficients(np.ndarray): Array (n+3, 2) of weights of centers and affine part (1, x, y).
+    
+    Raise:
+    ValueError: If number of points are different or less than 3.
+    """
+    
+    centers = np.asarray(sourcePoints, dtype=np.float64).reshape(-1, 2)
+    targets = np.asarray(targetPoints, dtype=np.float64).reshape(-1, 2)
+    if len(centers) != len(targets) or len(centers) < 3:
+        raise ValueError("thin-plate spline needs the same number (at least 3) of source and target points")
+    
+    count = len(centers)
+    difference = centers[:, None, :] - centers[None, :, :]
+    system = np.zeros((count + 3, count + 3))
+    system[:count, :count] = thinPlateKernel((difference ** 2).sum(axis=-1)) + regularization * np.eye(count)
+    system[:count, count] = 1
+    system[:count, count + 1:] = centers
+    system[count:, :count] = system[:count, count:].T
+    values = np.zeros((count + 3, 2))
+    values[:count] = targets
+    
+    return centers, np.linalg.solve(system, values)
+
+def evaluateThinPlateSpline(centers, coefficients, points):
+    """
+    Evaluate thin-plate spline at points in blocks so kernel matrix stays small.
+    
+    Parameters:
+    centers(np.ndarray): Array (n, 2) from fitThinPlateSpline.
+    coefficients(np.ndarray): Array (n+3, 2) from fitThinPlateSpline.
+    points(np.ndarray): Array (m, 2) of (x, y) to evaluate.
+    
+    Return:
+    values(np.ndarray): Array (m, 2) of (x', y') of each point.
+    """
+    
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(centers)
+    values = np.empty_like(points)
+    step = max(1, TILE_PIXELS // max(1, count))
+    
+    for start in range(0, len(points), step):
+        block = points[start:start + step]
+        squaredDistance = ((block ** 2).sum(axis=1)[:, None] + (centers ** 2).sum(axis=1)[None, :]
+                           - 2 * block @ centers.T)
+        np.maximum(squaredDistance, 0, out=squaredDistance)
+        values[start:start + step] = (thinPlateKernel(squaredDistance) @ coefficients[:count]
+                                      + coefficients[count] + block @ coefficients[count + 1:])
+    
+    return values
+
+def thinPlateSplineMaps(sourcePoints, targetPoints, height, width, latticeStep=8, regularization=0.0):
+    """
+    Compute coordinate maps of thin-plate spline warp from scattered control points.
+    Spline is evaluated only on a coarse lattice every latticeStep pixels (and the
+    last row and column), then its displacement is bilinearly upsampled to every
+    pixel, so the cost grows with pixels + lattice points * control points
+    instead of pixels * control points.
+    
+    Parameters:
+    sourcePoints(np.ndarray): Array (..., 2) of (x, y) of output control points.
+    targetPoints(np.ndarray): Array (..., 2) of (x', y') of input control points.
+    height(int): Height of output image.
+    width(int): Width of output image.
+    latticeStep(int): Distance of lattice points in pixels, 1 to evaluate every pixel.
+    regularization(float): Smoothing, 0 to pass exactly through every point.
+    
+    Returns:
+    mapX(np.ndarray): float32 array (height, width) of x' of each output pixel.
+    mapY(np.ndarray): float32 array (height, width) of y' of each output pixel.
+    """
+    
+    centers, coefficients = fitThinPlateSpline(sourcePoints, targetPoints, regularization)
+    latticeX = np.unique(np.append(np.arange(0, height, latticeStep), height - 1)).astype(np.float64)
+    latticeY = np.unique(np.append(np.arange(0, width, latticeStep), width - 1)).astype(np.float64)
+    lattice = np.stack(np.meshgrid(latticeX, latticeY, indexing='ij'), axis=-1)
+    displacement = evaluateThinPlateSpline(centers, coefficients, lattice) - lattice.reshape(-1, 2)
+    displacement = displacement.reshape(lattice.shape)
+    
+    def weights(lattice, positions):
+        if len(lattice) == 1:
+            return np.zeros(len(positions), dtype=np.intp), np.zeros(len(positions))
+        index = cellIndex(lattice, positions)
+        return index, (positions - lattice[index]) / (lattice[index + 1] - lattice[index])
+    
+    mapX = np.empty((height, width), dtype=np.float32)
+    mapY = np.empty((height, width), dtype=np.float32)
+    y = np.arange(width, dtype=np.float64)
+    columns, u = weights(latticeY, y)
+    nextColumns = np.minimum(columns + 1, len(latticeY) - 1)
+    u = u[None, :, None]
+    step = max(1, TILE_PIXELS // max(1, width))
+    
+    for start in range(0, height, step):
+        x = np.arange(start, min(start + step, height), dtype=np.float64)
+        rows, t = weights(latticeX, x)
+        nextRows = np.minimum(rows + 1, len(latticeX) - 1)
+        t = t[:, None, None]
+        upper = displacement[rows][:, columns] * (1 - u) + displacement[rows][:, nextColumns] * u
+        lower = displacement[nextRows][:, columns] * (1 - u) + displacement[nextRows][:, nextColumns] * u
+        mapped = upper * (1 - t) + lower * t
+        mapX[start:start + len(x)] = mapped[..., 0] + x[:, None]
+        mapY[start:start + len(x)] = mapped[..., 1] + y[None, :]
+    
+    return mapX, mapY
+
+def borderIndex(index, size, border):
+    """
+    Map indices outside of image to indices inside of image by border policy.
+    
+    Parameters:
+    index(np.ndarray): Integer indices of pixels, can be outside of image.
+    size(int): Number of pixels along the axis.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    
+    Returns:
+    index(np.ndarray): Indices inside of image.
+    inside(np.ndarray): Boolean of indices that were inside of image or None if
+    border is not 'constant'.
     """
-    Read a pgm file and return their header except format type and comment 
-    and return number of pixels.
+    
+    if border == 'constant':
+        inside = (index >= 0) & (index < size)
+        return np.clip(index, 0, size - 1), inside
+    if border == 'replicate':
+        return np.clip(index, 0, size - 1), None
+    
+    # reflect around edge pixels without repeating them e.g. -1 -> 1
+    period = max(1, 2 * (size - 1))
+    index = np.abs(index) % period
+    return np.where(index >= size, period - index, index), None
 
+def cubicWeights(fraction):
+    """
+    Weights of 4 neighbours (-1, 0, 1, 2) of cubic convolution (Keys, a = -0.5).
+    
     Parameter:
-    filePath(str): A path to pgm file.
+    fraction(np.ndarray): Fractional part of coordinates.
+    
+    Return:
+    weights(list): List of 4 arrays of weights.
+    """
+    
+    a = -0.5
+    t = fraction
+    s = 1 - fraction
+    w0 = ((a * (t + 1) - 5 * a) * (t + 1) + 8 * a) * (t + 1) - 4 * a
+    w1 = ((a + 2) * t - (a + 3)) * t * t + 1
+    w2 = ((a + 2) * s - (a + 3)) * s * s + 1
+    
+    return [w0, w1, w2, 1 - w0 - w1 - w2]
 
+def interpolate(pixels, baseX, baseY, fractionX, fractionY, interpolation='bilinear',
+                border='replicate', borderValue=0, origin=0, height=None):
+    """
+    Gather pixels around integer base coordinates and interpolate them by fractional parts.
+    
+    Parameters:
+    pixels(np.ndarray): Array (height, width) or (height, width, channels) of input pixels.
+    baseX(np.ndarray): Integer part (floor) of x' of each output pixel.
+    baseY(np.ndarray): Integer part (floor) of y' of each output pixel.
+    fractionX(np.ndarray): Fractional part of x' of each output pixel.
+    fractionY(np.ndarray): Fractional part of y' of each output pixel.
+    interpolation(str): 'nearest', 'bilinear' or 'bicubic'.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    borderValue(int): Value of pixels outside of image if border is 'constant'.
+    origin(int): Row of image of the first row of pixels when pixels are only a band of rows.
+    height(int): Height of the whole image or None if pixels are the whole image.
+    
+    Return:
+    values(np.ndarray): float64 interpolated values of output pixels.
+    """
+    
+    width = pixels.shape[1]
+    if height is None:
+        height = pixels.shape[0]
+    expand = (Ellipsis,) + (None,) * (pixels.ndim - 2)
+    
+    def gather(dx, dy):
+        x, insideX = borderIndex(baseX + dx, height, border)
+        y, insideY = borderIndex(baseY + dy, width, border)
+        values = pixels[x - origin, y].astype(np.float64)
+        if border == 'constant':
+            values[~(insideX & insideY)] = borderValue
+        return values
+    
+    if interpolation == 'nearest':
+        return gather((fractionX >= 0.5).astype(baseX.dtype), (fractionY >= 0.5).astype(baseY.dtype))
+    
+    fractionX = fractionX.astype(np.float64)[expand]
+    fractionY = fractionY.astype(np.float64)[expand]
+    
+    if interpolation == 'bilinear':
+        # same form as a*x + b*y + c*x*y + d of each cell
+        p00 = gather(0, 0); p10 = gather(1, 0); p01 = gather(0, 1); p11 = gather(1, 1)
+        a = p10 - p00
+        b = p01 - p00
+        c = p11 + p00 - p01 - p10
+        return a*fractionX + b*fractionY + c*fractionX*fractionY + p00
+    
+    weightsX = cubicWeights(fractionX)
+    weightsY = cubicWeights(fractionY)
+    values = 0
+    for dx, weightX in zip(range(-1, 3), weightsX):
+        row = 0
+        for dy, weightY in zip(range(-1, 3), weightsY):
+            row = row + weightY * gather(dx, dy)
+        values = values + weightX * row
+    return values
+
+def splitCoordinates(mapX, mapY):
+    """
+    Split input coordinates into integer base (floor) and fractional part.
+    
+    Parameters:
+    mapX(np.ndarray): Array of x' of output pixels.
+    mapY(np.ndarray): Array of y' of output pixels.
+    
     Returns:
-    width(int): Width of image.
-    height(int): Height of image.
-    maxGrayLevel(int): Max value of gray scale.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    baseX(np.ndarray): Integer part of x'.
+    baseY(np.ndarray): Integer part of y'.
+    fractionX(np.ndarray): Fractional part of x' with dtype of mapX.
+    fractionY(np.ndarray): Fractional part of y' with dtype of mapY.
+    """
+    
+    mapX = np.asarray(mapX)
+    mapY = np.asarray(mapY)
+    baseX = np.floor(mapX)
+    baseY = np.floor(mapY)
+    
+    return baseX.astype(np.intp), baseY.astype(np.intp), mapX - baseX, mapY - baseY
+
+def resample(pixels, blocks, shape, interpolation, border, borderValue, maxGrayLevel, out):
+    """
+    Interpolate output pixels block by block from base coordinates and fractional parts.
+    
+    Parameters:
+    pixels(np.ndarray): Array (height, width) or (height, width, channels) of input pixels.
+    blocks(iterable): Iterable of (start row, baseX, baseY, fractionX, fractionY) of each block.
+    shape(tuple): (rows, cols) of output image.
+    interpolation(str): 'nearest', 'bilinear' or 'bicubic'.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    borderValue(int): Value of pixels outside of image if border is 'constant'.
+    maxGrayLevel(int): Max value of output of integer pixels or None for max of dtype.
+    out(np.ndarray): Array to write output or None.
+    
+    Return:
+    out(np.ndarray): Array (rows, cols) or (rows, cols, channels) of output pixels.
+    
+    Raise:
+    ValueError: If interpolation or border is not supported.
+    """
+    
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError("interpolation must be one of " + ", ".join(INTERPOLATIONS))
+    if border not in BORDERS:
+        raise ValueError("border must be one of " + ", ".join(BORDERS))
+    
+    pixels = np.asarray(pixels)
+    if out is None:
+        out = np.empty(tuple(shape) + pixels.shape[2:], dtype=pixels.dtype)
+    isInteger = np.issubdtype(out.dtype, np.integer)
+    if isInteger and maxGrayLevel is None:
+        maxGrayLevel = np.iinfo(out.dtype).max
+    
+    for start, baseX, baseY, fractionX, fractionY in blocks:
+        values = interpolate(pixels, baseX, baseY, fractionX, fractionY, interpolation, border, borderValue)
+        if isInteger:
+            values = np.clip(np.rint(values), 0, maxGrayLevel)
+        out[start:start + len(values)] = values
+    
+    return out
+
+def remap(pixels, mapX, mapY, interpolation='bilinear', border='replicate', borderValue=0,
+          maxGrayLevel=None, out=None):
+    """
+    Resample pixels at input coordinate (mapX, mapY) of every output pixel.
+    Output pixels are processed in blocks of rows so temporaries stay small.
+    Maps can have any size, output image has the same shape as maps.
+    
+    Parameters:
+    pixels(np.ndarray): Array (height, width) or (height, width, channels) of input pixels.
+    mapX(np.ndarray): Array (rows, cols) of x' of each output pixel.
+    mapY(np.ndarray): Array (rows, cols) of y' of each output pixel.
+    interpolation(str): 'nearest', 'bilinear' or 'bicubic'.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    borderValue(int): Value of pixels outside of image if border is 'constant'.
+    maxGrayLevel(int): Max value of output of integer pixels or None for max of dtype.
+    out(np.ndarray): Array to write output or None.
+    
+    Return:
+    out(np.ndarray): Array (rows, cols) or (rows, cols, channels) of output pixels.
+    
+    Raise:
+    ValueError: If interpolation or border is not supported or maps have different shapes.
+    """
+    
+    if np.shape(mapX) != np.shape(mapY):
+        raise ValueError("mapX and mapY must have the same shape")
+    
+    rows, cols = np.shape(mapX)
+    step = max(1, TILE_PIXELS // max(1, cols))
+    blocks = ((start,) + splitCoordinates(mapX[start:start + step], mapY[start:start + step])
+              for start in range(0, rows, step))
+    
+    return resample(pixels, blocks, (rows, cols), interpolation, border, borderValue, maxGrayLevel, out)
+
+def warpMap(mapX, mapY):
+    """
+    Precompute integer base indices and fractional weights of coordinate maps
+    as one structured array, so correcting a frame is only the gather.
+    Base indices are int16 if they fit, otherwise int32.
+    
+    Parameters:
+    mapX(np.ndarray): Array (rows, cols) of x' of each output pixel.
+    mapY(np.ndarray): Array (rows, cols) of y' of each output pixel.
+    
+    Return:
+    warp(np.ndarray): Structured array (rows, cols) with fields baseX, baseY,
+    fractionX and fractionY.
+    
+    Raise:
+    ValueError: If maps have different shapes.
+    """
+    
+    if np.shape(mapX) != np.shape(mapY):
+        raise ValueError("mapX and mapY must have the same shape")
+    
+    baseX, baseY, fractionX, fractionY = splitCoordinates(np.asarray(mapX, dtype=np.float32),
+                                                          np.asarray(mapY, dtype=np.float32))
+    limits = np.iinfo(np.int16)
+    fits = all(base.size == 0 or (limits.min <= base.min() and base.max() <= limits.max)
+               for base in (baseX, baseY))
+    indexType = np.int16 if fits else np.int32
+    warp = np.empty(np.shape(mapX), dtype=[('baseX', indexType), ('baseY', indexType),
+                                           ('fractionX', np.float32), ('fractionY', np.float32)])
+    warp['baseX'] = baseX
+    warp['baseY'] = baseY
+    warp['fractionX'] = fractionX
+    warp['fractionY'] = fractionY
+    
+    return warp
 
+def saveWarpMap(filePath, mapX, mapY):
+    """
+    Save precomputed warp map of coordinate maps to .npy or .npz file.
+    .npy keeps one structured array that can be memory-mapped by loadWarpMap,
+    .npz keeps the four fields as separate arrays.
+    
+    Parameters:
+    filePath(str): A path of output file that ends with .npy or .npz.
+    mapX(np.ndarray): Array (rows, cols) of x' of each output pixel.
+    mapY(np.ndarray): Array (rows, cols) of y' of each output pixel.
+    
     Raise:
-    ValueError: If the file type is not a P5 format.
+    ValueError: If file is not .npy or .npz.
     """
+    
+    warp = warpMap(mapX, mapY)
+    if filePath.endswith('.npy'):
+        np.save(filePath, warp)
+    elif filePath.endswith('.npz'):
+        np.savez(filePath, **{name: warp[name] for name in warp.dtype.names})
+    else:
+        raise ValueError("warp map file must be .npy or .npz")
 
-    file = open(filePath,"rb")
+def loadWarpMap(filePath):
+    """
+    Load warp map saved by saveWarpMap. A .npy file is memory-mapped read-only
+    so only rows that are used are read from disk.
+    
+    Parameter:
+    filePath(str): A path of .npy or .npz file.
+    
+    Return:
+    warp(np.ndarray or dict): Warp map with baseX, baseY, fractionX and fractionY.
+    
+    Raise:
+    ValueError: If file is not .npy or .npz.
+    """
+    
+    if filePath.endswith('.npy'):
+        return np.load(filePath, mmap_mode='r')
+    if filePath.endswith('.npz'):
+        with np.load(filePath) as data:
+            return {name: data[name] for name in data.files}
+    raise ValueError("warp map file must be .npy or .npz")
 
-    fileType = file.readline().decode().strip()
-    if fileType != "P5":
-        raise ValueError("not a PGM P5 format")
+def applyWarp(pixels, warp, interpolation='bilinear', border='replicate', borderValue=0,
+              maxGrayLevel=None, out=None):
+    """
+    Resample pixels with precomputed warp map from warpMap or loadWarpMap.
+    Gives the same output as remap with float32 coordinate maps.
+    
+    Parameters:
+    pixels(np.ndarray): Array (height, width) or (height, width, channels) of input pixels.
+    warp(np.ndarray or dict): Warp map with baseX, baseY, fractionX and fractionY.
+    interpolation(str): 'nearest', 'bilinear' or 'bicubic'.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    borderValue(int): Value of pixels outside of image if border is 'constant'.
+    maxGrayLevel(int): Max value of output of integer pixels or None for max of dtype.
+    out(np.ndarray): Array to write output or None.
+    
+    Return:
+    out(np.ndarray): Array (rows, cols) or (rows, cols, channels) of output pixels.
+    """
     
-    while True:
-        line = file.readline().decode().strip()
-        if not line.startswith('#'):
-            dimension = line
-            break
+    rows, cols = warp['baseX'].shape
+    step = max(1, TILE_PIXELS // max(1, cols))
 
-    maxGrayLevel = int(file.readline().decode().strip())
-    width, height = map(int, dimension.split())
+    def block(start):
+        rows = slice(start, start + step)
+        return (start,
+                np.asarray(warp['baseX'][rows], dtype=np.intp), np.asarray(warp['baseY'][rows], dtype=np.intp),
+                np.asarray(warp['fractionX'][rows]), np.asarray(warp['fractionY'][rows]))
 
-    pixel_data = file.read()
-    pixels = [ list(pixel_data[row * width : (row + 1) * width]) for row in range(height)]
+    blocks = (block(start) for start in range(0, rows, step))
 
-    return width, height, maxGrayLevel, pixels
+    return resample(pixels, blocks, (rows, cols), interpolation, border, borderValue, maxGrayLevel, out)
 
-def writePGM(filePath, header, pixels):
+def sharedArray(shape, dtype):
     """
-    Write binary pgm file from file path, header and pixels.
+    Allocate array in new shared memory that worker processes can attach.
     
     Parameters:
-    filePath(str): A path of output file.
-    header(list): List of header of PGM file. 
-    pixels(bytes): Pixels of output image.
+    shape(tuple): Shape of array.
+    dtype(np.dtype): Type of array.
+    
+    Returns:
+    array(np.ndarray): Array over the shared memory.
+    spec(tuple): Description of array for attachArray.
+    memory(SharedMemory): Shared memory that caller must close and unlink once array is deleted.
     """
     
-    file = open(filePath, "wb")
-    file.write("\n".join(header).encode() + b"\n")
-    file.write(pixels)
+    from multiprocessing import shared_memory
+    dtype = np.dtype(dtype)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    return array, ('shared', memory.name, 0, tuple(shape), dtype.str), memory
 
-def writePixelsToPGM(filePathOutput , width, height, maxGrayLevel, pixels):
+def shareArray(array, readOnly=True, copy=True):
     """
-    Write pixels to PGM file.
+    Describe array so worker processes can open it without pickling pixels.
+    Memory-mapped file whose mapping is shared with the file (mode 'r', 'r+' or
+    'w+') is opened again from the file. Other arrays, including copy-on-write
+    maps of readPGM that may have been changed in memory only, are copied once
+    into shared memory.
     
     Parameters:
-    filePathOutput(str): A path of output file.
-    width(int): Width of image.
-    height(int): Height of image.
-    maxGrayLevel(int): Max value of gray scale of image.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    array(np.ndarray): Array to share.
+    readOnly(bool): False if workers write to array.
+    copy(bool): False to allocate shared memory of the same shape without copying
+    array into it, e.g. for output that workers fill.
+    
+    Returns:
+    spec(tuple): Description of array for attachArray.
+    memory(SharedMemory): Shared memory that caller must close and unlink or None.
     """
     
-    header = ["P5", str(width)+" "+str(height), str(maxGrayLevel)]
-    pixels2Dto1D = bytes(sum(pixels, []))
-    pixels = pixels2Dto1D
-    writePGM(filePathOutput, header, pixels)
+    if isinstance(array, np.memmap) and array.flags.c_contiguous:
+        # a view of memmap keeps offset of the whole mapping, find where view starts in file
+        mapping = array
+        while isinstance(mapping.base, np.memmap):
+            mapping = mapping.base
+        if mapping.filename is not None and (mapping.mode in ('r+', 'w+') or (readOnly and mapping.mode == 'r')):
+            offset = array.ctypes.data - mapping.ctypes.data + mapping.offset
+            return ('r' if readOnly else 'r+', mapping.filename, offset, array.shape, array.dtype.str), None
     
-def spatialTranform(grid, distGrid, refPoint):
-    # grid x
-    xy = np.array([
-        [grid[refPoint[0]]['x'], grid[refPoint[0]]['y'], grid[refPoint[0]]['x']*grid[refPoint[0]]['y'], 1],
-        [grid[refPoint[1]]['x'], grid[refPoint[1]]['y'], grid[refPoint[1]]['x']*grid[refPoint[1]]['y'], 1],
-        [grid[refPoint[2]]['x'], grid[refPoint[2]]['y'], grid[refPoint[2]]['x']*grid[refPoint[2]]['y'], 1],
-        [grid[refPoint[3]]['x'], grid[refPoint[3]]['y'], grid[refPoint[3]]['x']*grid[refPoint[3]]['y'], 1]    
-        ])
-    
-    # Distgrid x'
-    x_ = np.array([
-                distGrid[refPoint[0]]['x'], 
-                distGrid[refPoint[1]]['x'], 
-                distGrid[refPoint[2]]['x'], 
-                distGrid[refPoint[3]]['x']
-                ])
-    coeX = np.linalg.solve(xy, x_)
-
-    # Distgrid y'
-    y_ = np.array([
-                distGrid[refPoint[0]]['y'], 
-                distGrid[refPoint[1]]['y'], 
-                distGrid[refPoint[2]]['y'], 
-                distGrid[refPoint[3]]['y']
-                ])
-    coeY = np.linalg.solve(xy, y_)
-    
-    inputCoor = []
-    xUpLeft = grid[refPoint[0]]['x']
-    xDownLeft = grid[refPoint[2]]['x']
-    yUpLeft = grid[refPoint[0]]['y']
-    yUpRight = grid[refPoint[1]]['y']
-    
-    for x in range(xUpLeft, xDownLeft+1):
-        result = []
-        for y in range(yUpLeft, yUpRight+1):
-            x_i = coeX[0]*x + coeX[1]*y + coeX[2]*x*y + coeX[3]
-            y_i = coeY[0]*x + coeY[1]*y + coeY[2]*x*y + coeY[3]
-            result.append({"x'": x_i, "y'": y_i})
-        inputCoor.append(result)
-    inputCoor = np.array(inputCoor)
-    
-    return inputCoor
-
-def bilearInterpolate(inputCoor, pixelsDistGrid):
-    res = []
-    height = 256
-    width = 256
-    for blockI in range(len(inputCoor)):
-        for blockJ in range(len(inputCoor[0])):
-            for row in range(len(inputCoor[blockI][blockJ])):
-                for col in range(len(inputCoor[blockI][blockJ][0])):
-                    x = inputCoor[blockI][blockJ][row][col]["x'"]
-                    y = inputCoor[blockI][blockJ][row][col]["y'"]
-                    xPoint = int(x); yPoint = int(y)
-                    
-                    if 0 <= xPoint < height and 0 <= yPoint < width:
-                        x0 = xPoint
-                        y0 = yPoint
-                        x1 = min(x0 + 1, height - 1)
-                        y1 = min(y0 + 1, width - 1)
-                    
-                        #real (x,y)
-                        x = x%1; y = y%1
-                        #calculate color
-                        a = pixelsDistGrid[x1][y0] - pixelsDistGrid[x0][y0]
-                        b = pixelsDistGrid[x0][y1] - pixelsDistGrid[x0][y0]
-                        c = pixelsDistGrid[x1][y1] + pixelsDistGrid[x0][y0] - pixelsDistGrid[x0][y1] - pixelsDistGrid[x1][y0]
-                        d = pixelsDistGrid[x0][y0]
-                        result = round(a*x + b*y + c*x*y + d)
-                        res.append(result)
-    return res
+    shared, spec, memory = sharedArray(array.shape, array.dtype)
+    if copy:
+        shared[...] = array
+    return spec, memory
+
+def attachArray(spec):
+    """
+    Open array described by shareArray or sharedArray.
+    
+    Parameter:
+    spec(tuple): Description of array from shareArray or sharedArray.
+    
+    Returns:
+    array(np.ndarray): Array over the file or the shared memory.
+    memory(SharedMemory): Shared memory that caller must close or None.
+    """
+    
+    kind, name, offset, shape, dtype = spec
+    if kind != 'shared':
+        return np.memmap(name, dtype=dtype, mode=kind, offset=offset, shape=shape), None
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=memory.buf), memory
+
+def warpRows(source, output, gridPoints, distPoints, start, stop, interpolation, border,
+             borderValue, maxGrayLevel):
+    """
+    Solve coefficients of cells that cover output rows start to stop and
+    interpolate those rows straight into output.
+    
+    Parameters:
+    source(np.ndarray or tuple): Input pixels or spec of shared input pixels.
+    output(np.ndarray or tuple): Output pixels or spec of shared output pixels.
+    gridPoints(np.ndarray): Array (rows, cols, 2) of control points of output.
+    distPoints(np.ndarray): Array (rows, cols, 2) of control points of input.
+    start(int): First output row.
+    stop(int): Row after the last output row.
+    interpolation(str): 'nearest', 'bilinear' or 'bicubic'.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    borderValue(int): Value of pixels outside of image if border is 'constant'.
+    maxGrayLevel(int): Max value of output of integer pixels or None for max of dtype.
+    """
+    
+    memories = []
+    if isinstance(source, tuple):
+        source, memory = attachArray(source)
+        memories.append(memory)
+    if isinstance(output, tuple):
+        output, memory = attachArray(output)
+        memories.append(memory)
+    
+    try:
+        edges = gridPoints[:, 0, 0]
+        first = cellIndex(edges, np.array([start]))[0]
+        last = cellIndex(edges, np.array([stop - 1]))[0]
+        cells = slice(first, last + 2)
+        coefficients = solveCells(gridPoints[cells], distPoints[cells])
+        mapX, mapY = coordinateMaps(gridPoints[cells], coefficients, output.shape[0], output.shape[1], (start, stop))
+        remap(source, mapX, mapY, interpolation, border, borderValue, maxGrayLevel, out=output[start:stop])
+    finally:
+        del source, output
+        for memory in memories:
+            if memory is not None:
+                memory.close()
+
+def warpTiles(pixels, gridPoints, distPoints, height, width, interpolation='bilinear', border='replicate',
+              borderValue=0, maxGrayLevel=None, out=None, tileRows=None, workers=None, processes=None):
+    """
+    Warp image by bilinear mesh of control points with tiles of output rows
+    running in parallel. Each tile solves only the cells it covers and
+    interpolates its rows straight into the output, tiles are independent.
+    Threads share pixels directly. Processes open input and output from shared
+    memory (or from the file of memory-mapped arrays) so pixels are never pickled.
+    
+    Parameters:
+    pixels(np.ndarray): Array (height, width) or (height, width, channels) of input pixels.
+    gridPoints(np.ndarray): Array (rows, cols, 2) of control points of output.
+    distPoints(np.ndarray): Array (rows, cols, 2) of control points of input.
+    height(int): Height of output image.
+    width(int): Width of output image.
+    interpolation(str): 'nearest', 'bilinear' or 'bicubic'.
+    border(str): 'constant', 'replicate' or 'reflect'.
+    borderValue(int): Value of pixels outside of image if border is 'constant'.
+    maxGrayLevel(int): Max value of output of integer pixels or None for max of dtype.
+    out(np.ndarray): Array to write output or None.
+    tileRows(int): Number of output rows of each tile or None for 4 tiles per worker.
+    workers(int): Number of threads or None for number of cores.
+    processes(int): Number of processes or None to use threads.
+    
+    Return:
+    out(np.ndarray): Array (height, width) or (height, width, channels) of output pixels.
+    
+    Raise:
+    ValueError: If interpolation or border is not supported.
+    """
+    
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError("interpolation must be one of " + ", ".join(INTERPOLATIONS))
+    if border not in BORDERS:
+        raise ValueError("border must be one of " + ", ".join(BORDERS))
+    
+    gridPoints = np.asarray(gridPoints, dtype=np.float64)
+    distPoints = np.asarray(distPoints, dtype=np.float64)
+    shape = (height, width) + np.shape(pixels)[2:]
+    useProcesses = processes is not None and processes > 1
+    count = processes if useProcesses else (workers or os.cpu_count() or 1)
+    if tileRows is None:
+        tileRows = -(-height // (4 * count))
+    tiles = [(start, min(start + tileRows, height)) for start in range(0, height, max(1, tileRows))]
+    arguments = (interpolation, border, borderValue, maxGrayLevel)
+    import concurrent.futures
+    
+    if not useProcesses:
+        pixels = np.asarray(pixels)
+        if out is None:
+            out = np.empty(shape, dtype=pixels.dtype)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            list(executor.map(lambda tile: warpRows(pixels, out, gridPoints, distPoints, *tile, *arguments), tiles))
+        return out
+    
+    # workers write straight into output: new output is returned over the shared memory
+    # it was filled in, memory is freed with the array. Output of caller that is not
+    # writable memory-mapped file is separate memory, only then result is copied back.
+    copyBack = out is not None
+    if out is None:
+        out, output, outputMemory = sharedArray(shape, np.asarray(pixels).dtype)
+        weakref.finalize(out, outputMemory.close).atexit = False
+    else:
+        output, outputMemory = shareArray(out, readOnly=False, copy=False)
+        copyBack = outputMemory is not None
+    source, sourceMemory = shareArray(pixels)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            parts = [executor.submit(warpRows, source, output, gridPoints, distPoints, start, stop, *arguments)
+                     for start, stop in tiles]
+            for part in parts:
+                part.result()
+        if copyBack:
+            out[...] = np.ndarray(out.shape, dtype=out.dtype, buffer=outputMemory.buf)
+    finally:
+        # unlinking removes only the name, memory of returned output stays mapped
+        for memory in (sourceMemory, outputMemory):
+            if memory is not None:
+                memory.unlink()
+                if memory is sourceMemory or copyBack:
+                    memory.close()
+    
+    return out
 
 #main
-filePathInGrid = 'in/grid.pgm'
-filePathInDistGrid = 'in/NewDistGrid_256_256PGM.pgm'
-filePathInOpera = 'in/DistOperaHouse_256_256PGM_Gray.pgm'
-
-width, height, maxGrayLevel, pixelsGrid = readPGM(filePathInGrid)
-width, height, maxGrayLevel, pixelsDistGrid = readPGM(filePathInDistGrid)
-width, height, maxGrayLevelOp, pixelsOpera = readPGM(filePathInOpera)
-
-grid = []
-for x in range(-1, 256, 16):
-    result = []
-    for y in range(-1, 256, 16):
-        if x == -1:
-            x = 0
-        if y == -1:
-            y = 0
-        result.append({'x': x, 'y': y})
-    grid.append(result)
-
-distGrid = [
-    [{'x': 0, 'y': 0}, {'x': 0, 'y': 15}, {'x': 0, 'y': 31}, {'x': 0, 'y': 47}, {'x': 0, 'y': 63}, {'x': 0, 'y': 79}, {'x': 0, 'y': 95}, {'x': 0, 'y': 111}, {'x': 0, 'y': 127}, {'x': 0, 'y': 143}, {'x': 0, 'y': 159}, {'x': 0, 'y': 175}, {'x': 0, 'y': 191}, {'x': 0, 'y': 207}, {'x': 0, 'y': 223}, {'x': 0, 'y': 239}, {'x': 0, 'y': 255}], 
-    [{'x': 15, 'y': 0}, {'x': 15, 'y': 15}, {'x': 15, 'y': 31}, {'x': 15, 'y': 47}, {'x': 15, 'y': 63}, {'x': 15, 'y': 79}, {'x': 15, 'y': 97}, {'x': 15, 'y': 115}, {'x': 15, 'y': 131}, {'x': 15, 'y': 146}, {'x': 15, 'y': 162}, {'x': 15, 'y': 175}, {'x': 15, 'y': 191}, {'x': 15, 'y': 207}, {'x': 15, 'y': 223}, {'x': 15, 'y': 239}, {'x': 15, 'y': 255}], 
-    [{'x': 31, 'y': 0}, {'x': 31, 'y': 15}, {'x': 31, 'y': 31}, {'x': 31, 'y': 47}, {'x': 30, 'y': 65}, {'x': 28, 'y': 85}, {'x': 28, 'y': 105}, {'x': 29, 'y': 123}, {'x': 32, 'y': 141}, {'x': 34, 'y': 156}, {'x': 34, 'y': 168}, {'x': 34, 'y': 180}, {'x': 32, 'y': 193}, {'x': 31, 'y': 207}, {'x': 31, 'y': 223}, {'x': 31, 'y': 239}, {'x': 31, 'y': 255}], 
-    [{'x': 47, 'y': 0}, {'x': 47, 'y': 15}, {'x': 47, 'y': 31}, {'x': 44, 'y': 50}, {'x': 41, 'y': 71}, {'x': 40, 'y': 94}, {'x': 41, 'y': 116}, {'x': 46, 'y': 136}, {'x': 51, 'y': 153}, {'x': 56, 'y': 167}, {'x': 57, 'y': 178}, {'x': 56, 'y': 188}, {'x': 53, 'y': 198}, {'x': 49, 'y': 209}, {'x': 47, 'y': 223}, {'x': 47, 'y': 239}, {'x': 47, 'y': 255}], 
-    [{'x': 63, 'y': 0}, {'x': 63, 'y': 15}, {'x': 61, 'y': 33}, {'x': 55, 'y': 53}, {'x': 51, 'y': 78}, {'x': 51, 'y': 104}, {'x': 56, 'y': 127}, {'x': 64, 'y': 148}, {'x': 74, 'y': 163}, {'x': 82, 'y': 176}, {'x': 84, 'y': 185}, {'x': 82, 'y': 193}, {'x': 78, 'y': 203}, {'x': 70, 'y': 213}, {'x': 65, 'y': 224}, {'x': 63, 'y': 239}, {'x': 63, 'y': 255}], 
-    [{'x': 79, 'y': 0}, {'x': 78, 'y': 15}, {'x': 73, 'y': 35}, {'x': 65, 'y': 57}, {'x': 60, 'y': 83}, {'x': 62, 'y': 111}, {'x': 70, 'y': 136}, {'x': 85, 'y': 155}, {'x': 100, 'y': 167}, {'x': 109, 'y': 175}, {'x': 113, 'y': 183}, {'x': 110, 'y': 193}, {'x': 104, 'y': 204}, {'x': 94, 'y': 214}, {'x': 85, 'y': 226}, {'x': 80, 'y': 239}, {'x': 79, 'y': 255}], 
-    [{'x': 95, 'y': 0}, {'x': 93, 'y': 16}, {'x': 85, 'y': 35}, {'x': 75, 'y': 58}, {'x': 69, 'y': 85}, {'x': 71, 'y': 113}, {'x': 83, 'y': 138}, {'x': 103, 'y': 153}, {'x': 121, 'y': 159}, {'x': 133, 'y': 163}, {'x': 137, 'y': 172}, {'x': 135, 'y': 185}, {'x': 127, 'y': 199}, {'x': 116, 'y': 213}, {'x': 105, 'y': 226}, {'x': 97, 'y': 240}, {'x': 95, 'y': 255}], 
-    [{'x': 111, 'y': 0}, {'x': 107, 'y': 16}, {'x': 98, 'y': 34}, {'x': 86, 'y': 57}, {'x': 79, 'y': 83}, {'x': 80, 'y': 110}, {'x': 93, 'y': 133}, {'x': 114, 'y': 145}, {'x': 133, 'y': 143}, {'x': 145, 'y': 143}, {'x': 154, 'y': 153}, {'x': 155, 'y': 170}, {'x': 149, 'y': 190}, {'x': 138, 'y': 208}, {'x': 124, 'y': 224}, {'x': 115, 'y': 239}, {'x': 111, 'y': 255}], 
-    [{'x': 127, 'y': 0}, {'x': 122, 'y': 15}, {'x': 112, 'y': 32}, {'x': 100, 'y': 52}, {'x': 91, 'y': 75}, {'x': 88, 'y': 101}, {'x': 96, 'y': 122}, {'x': 113, 'y': 133}, {'x': 129, 'y': 127}, {'x': 144, 'y': 123}, {'x': 159, 'y': 134}, {'x': 167, 'y': 155}, {'x': 165, 'y': 179}, {'x': 154, 'y': 203}, {'x': 141, 'y': 222}, {'x': 132, 'y': 238}, {'x': 127, 'y': 255}], 
-    [{'x': 143, 'y': 0}, {'x': 139, 'y': 15}, {'x': 129, 'y': 30}, {'x': 117, 'y': 46}, {'x': 106, 'y': 65}, {'x': 99, 'y': 86}, {'x': 101, 'y': 104}, {'x': 110, 'y': 114}, {'x': 123, 'y': 112}, {'x': 142, 'y': 110}, {'x': 163, 'y': 121}, {'x': 175, 'y': 144}, {'x': 176, 'y': 172}, {'x': 168, 'y': 198}, {'x': 157, 'y': 219}, {'x': 147, 'y': 238}, {'x': 143, 'y': 255}], 
-    [{'x': 159, 'y': 0}, {'x': 156, 'y': 15}, {'x': 148, 'y': 28}, {'x': 137, 'y': 41}, {'x': 126, 'y': 56}, {'x': 118, 'y': 70}, {'x': 116, 'y': 84}, {'x': 121, 'y': 93}, {'x': 133, 'y': 96}, {'x': 152, 'y': 101}, {'x': 171, 'y': 116}, {'x': 183, 'y': 141}, {'x': 185, 'y': 169}, {'x': 179, 'y': 196}, {'x': 170, 'y': 219}, {'x': 161, 'y': 238}, {'x': 159, 'y': 255}], 
-    [{'x': 175, 'y': 0}, {'x': 174, 'y': 15}, {'x': 168, 'y': 28}, {'x': 159, 'y': 40}, {'x': 150, 'y': 50}, {'x': 143, 'y': 61}, {'x': 140, 'y': 71}, {'x': 144, 'y': 80}, {'x': 154, 'y': 88}, {'x': 170, 'y': 99}, {'x': 184, 'y': 117}, {'x': 194, 'y': 143}, {'x': 194, 'y': 171}, {'x': 189, 'y': 197}, {'x': 182, 'y': 219}, {'x': 176, 'y': 239}, {'x': 175, 'y': 255}], 
-    [{'x': 191, 'y': 0}, {'x': 191, 'y': 15}, {'x': 188, 'y': 30}, {'x': 182, 'y': 41}, {'x': 175, 'y': 51}, {'x': 170, 'y': 60}, {'x': 168, 'y': 69}, {'x': 171, 'y': 78}, {'x': 178, 'y': 90}, {'x': 189, 'y': 105}, {'x': 198, 'y': 125}, {'x': 204, 'y': 150}, {'x': 203, 'y': 176}, {'x': 199, 'y': 200}, {'x': 194, 'y': 221}, {'x': 191, 'y': 239}, {'x': 191, 'y': 255}], 
-    [{'x': 207, 'y': 0}, {'x': 207, 'y': 15}, {'x': 207, 'y': 31}, {'x': 204, 'y': 44}, {'x': 200, 'y': 55}, {'x': 196, 'y': 65}, {'x': 195, 'y': 75}, {'x': 198, 'y': 86}, {'x': 202, 'y': 99}, {'x': 208, 'y': 115}, {'x': 213, 'y': 137}, {'x': 215, 'y': 159}, {'x': 213, 'y': 182}, {'x': 210, 'y': 205}, {'x': 208, 'y': 224}, {'x': 207, 'y': 239}, {'x': 207, 'y': 255}], 
-    [{'x': 223, 'y': 0}, {'x': 223, 'y': 15}, {'x': 223, 'y': 31}, {'x': 223, 'y': 47}, {'x': 221, 'y': 60}, {'x': 219, 'y': 72}, {'x': 219, 'y': 84}, {'x': 220, 'y': 97}, {'x': 221, 'y': 111}, {'x': 224, 'y': 128}, {'x': 226, 'y': 148}, {'x': 226, 'y': 169}, {'x': 225, 'y': 188}, {'x': 223, 'y': 207}, {'x': 223, 'y': 223}, {'x': 223, 'y': 239}, {'x': 223, 'y': 255}], 
-    [{'x': 239, 'y': 0}, {'x': 239, 'y': 15}, {'x': 239, 'y': 31}, {'x': 239, 'y': 47}, {'x': 239, 'y': 63}, {'x': 239, 'y': 79}, {'x': 239, 'y': 93}, {'x': 239, 'y': 107}, {'x': 239, 'y': 123}, {'x': 239, 'y': 139}, {'x': 239, 'y': 156}, {'x': 239, 'y': 174}, {'x': 239, 'y': 191}, {'x': 239, 'y': 207}, {'x': 239, 'y': 223}, {'x': 239, 'y': 239}, {'x': 239, 'y': 255}], 
-    [{'x': 255, 'y': 0}, {'x': 255, 'y': 15}, {'x': 255, 'y': 31}, {'x': 255, 'y': 47}, {'x': 255, 'y': 63}, {'x': 255, 'y': 79}, {'x': 255, 'y': 95}, {'x': 255, 'y': 111}, {'x': 255, 'y': 127}, {'x': 255, 'y': 143}, {'x': 255, 'y': 159}, {'x': 255, 'y': 175}, {'x': 255, 'y': 191}, {'x': 255, 'y': 207}, {'x': 255, 'y': 223}, {'x': 255, 'y': 239}, {'x': 255, 'y': 255}]
-]
-
-grid = np.array(grid)
-distGrid = np.array(distGrid)
-
-inputCoor = []
-for x in range(16):
-    result = []
-    
-    for y in range(16):
-        p1 = (x, y)
-        p2 = (x, y+1)
-        p3 = (x+1, y)
-        p4 = (x+1, y+1)
-        refPoint = [p1, p2, p3, p4]
-        result.append(spatialTranform(grid, distGrid, refPoint))
-        
-    inputCoor.append(result)
+if __name__ == "__main__":
+    filePathInGrid = 'in/grid.pgm'
+    filePathInDistGrid = 'in/NewDistGrid_256_256PGM.pgm'
+    filePathInOpera = 'in/DistOperaHouse_256_256PGM_Gray.pgm'
+    filePathWarp = 'out/OperaWarp.npy'
 
-res = bilearInterpolate(inputCoor, pixelsOpera)
+    width, height, maxGrayLevel, pixelsGrid = readPGM(filePathInGrid)
+    width, height, maxGrayLevel, pixelsDistGrid = readPGM(filePathInDistGrid)
+    width, height, maxGrayLevelOp, pixelsOpera = readPGM(filePathInOpera)
 
-# writePixelsToPGM('out/Opera.pgm', width, height, maxGrayLevelOp, res)
+    # the distortion is fixed so warp map is computed once and reused until either
+    # calibration image is newer than the map
+    isStale = (not os.path.exists(filePathWarp)
+               or os.path.getmtime(filePathWarp) < max(os.path.getmtime(filePathInGrid),
+                                                         os.path.getmtime(filePathInDistGrid)))
+    if isStale:
+        gridPoints, distPoints = detectGrid(pixelsGrid, pixelsDistGrid)
+        mapX, mapY = coordinateMaps(gridPoints, solveCells(gridPoints, distPoints), height, width)
+        saveWarpMap(filePathWarp, mapX, mapY)
+    res = applyWarp(pixelsOpera, loadWarpMap(filePathWarp), maxGrayLevel=maxGrayLevelOp)
 
-header = ["P5", str(256)+" "+str(256), str(255)]
-file = open('out/Opera.pgm', "wb")
-file.write("\n".join(header).encode() + b"\n")
-file.write(bytes(res))
\ No newline at end of file
+    writePixelsToPGM('out/Opera.pgm', width, height, maxGrayLevelOp, res)
@@ -1,70 +1,178 @@
-def readPGM(filepath):
+import numpy as np
+
+from ImageIO import pixelType, readHeader, readPGM
+
+# number of pixels of one tile, bound the memory of temporary copies
+TILE_PIXELS = 1 << 20
+
+def createHistogram(pixels, maxGrayLevel, mask=None):
     """
-    Read a pgm file and return their header except format type and comment 
-    and return number of pixels.
+    Create histogram by counting each pixel in pixels with bincount.
+    Pixels are counted tile by tile so the image is never copied as a whole.
+    With mask only pixels in region of interest are counted.
 
-    Parameter:
-    filepath(str): A path to pgm file.
+    Parameters:
+    pixels(list or np.ndarray): 2D pixels that contain each pixel in pgm file.
+    maxGrayLevel(int): Max value of gray scale.
+    mask(np.ndarray): Boolean array of the same shape as pixels that is True
+    in region of interest or None to count every pixel.
 
-    Returns:
-    width(int): Width of image.
-    height(int): Height of image.
+    Return:
+    histogram(np.ndarray): histogram of pgm file with maxGrayLevel+1 int64 counts.
+
+    Raise:
+    ValueError: If a pixel is greater than max gray level or mask has different shape.
+    """
+
+    pixels = np.asarray(pixels)
+    levels = maxGrayLevel + 1
+
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != pixels.shape:
+            raise ValueError("mask must have the same shape as pixels")
+    # bincount copies strided pixels and casts them to intp, a tile at a time bounds that copy
+    histogram = np.zeros(levels, dtype=np.int64)
+    step = max(1, TILE_PIXELS // max(1, int(np.prod(pixels.shape[1:]))))
+    for start in range(0, len(pixels), step):
+        tile = pixels[start:start + step]
+        tile = tile.ravel() if mask is None else tile[mask[start:start + step]]
+        counts = np.bincount(tile, minlength=levels)
+        if len(counts) > levels:
+            raise ValueError("pixel is greater than max gray level")
+        histogram += counts
+
+    return histogram
+
+def createHistograms(images, maxGrayLevel, masks=None):
+    """
+    Create histogram of each image of a stack of images in one call.
+    Small images are counted many at a time by one bincount.
+
+    Parameters:
+    images(list or np.ndarray): Sequence of 2D pixels or 3D array (N, height, width).
     maxGrayLevel(int): Max value of gray scale.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    masks(list or np.ndarray): Boolean mask of each image or None to count every pixel.
+
+    Return:
+    histograms(np.ndarray): Array (N, maxGrayLevel+1) of int64 counts.
 
     Raise:
-    ValueError: If the file type is not a P5 format.
+    ValueError: If a pixel is greater than max gray level.
     """
 
-    file = open(filepath,"rb")
+    levels = maxGrayLevel + 1
+    histograms = np.zeros((len(images), levels), dtype=np.int64)
 
-    fileType = file.readline().decode().strip()
-    if fileType != "P5":
-        raise ValueError("not a PGM P5 format")
-    
-    while True:
-        line = file.readline().decode().strip()
-        if not line.startswith('#'):
-            dimension = line
-            break
-
-    maxGrayLevel = int(file.readline().decode().strip())
-    width, height = map(int, dimension.split())
-
-    pixel_data = file.read()
-    pixels = [ list(pixel_data[row * width : (row + 1) * width]) for row in range(height)]
- 
-    return width, height, maxGrayLevel, pixels
-    
-def createHistogram(pixels, maxGrayLevel):
+    if masks is None and isinstance(images, np.ndarray) and images.ndim == 3 and images[0].size:
+        frames = max(1, TILE_PIXELS // images[0].size)
+        for start in range(0, len(images), frames):
+            chunk = images[start:start + frames].reshape(-1, images[0].size)
+            if chunk.max() > maxGrayLevel:
+                raise ValueError("pixel is greater than max gray level")
+            offsets = np.arange(len(chunk), dtype=np.intp)[:, None] * levels
+            counts = np.bincount((chunk + offsets).ravel(), minlength=len(chunk) * levels)
+            histograms[start:start + frames] = counts.reshape(len(chunk), levels)
+        return histograms
+
+    for i, image in enumerate(images):
+        histograms[i] = createHistogram(image, maxGrayLevel, None if masks is None else masks[i])
+
+    return histograms
+
+def histogramOfRows(filePath, offset, width, rowStart, rowStop, maxGrayLevel, blockRows):
     """
-    Create histogram by counting each pixel in pixels.
+    Create histogram of rows of raw pgm file by reading block of rows at a time
+    into one reusable buffer.
 
     Parameters:
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    filePath(str): A path to pgm file.
+    offset(int): Byte offset of the first pixel in file.
+    width(int): Width of image.
+    rowStart(int): First row to count.
+    rowStop(int): Row after the last row to count.
     maxGrayLevel(int): Max value of gray scale.
+    blockRows(int): Number of rows of each block.
 
     Return:
-    histogram(list): histogram of pgm file.
+    histogram(np.ndarray): histogram of rows with maxGrayLevel+1 int64 counts.
+
+    Raise:
+    ValueError: If the file is truncated or a pixel is greater than max gray level.
     """
 
-    histogram = [0] * (maxGrayLevel + 1)
+    dtype = pixelType(maxGrayLevel)
+    histogram = np.zeros(maxGrayLevel + 1, dtype=np.int64)
+    buffer = np.empty(blockRows * width, dtype=dtype)
+
+    with open(filePath, "rb") as file:
+        file.seek(offset + rowStart * width * dtype.itemsize)
+        for start in range(rowStart, rowStop, blockRows):
+            count = min(blockRows, rowStop - start) * width
+            block = buffer[:count]
+            if file.readinto(block) != block.nbytes:
+                raise ValueError("pixels of pgm file are truncated")
+            counts = np.bincount(block, minlength=maxGrayLevel + 1)
+            if len(counts) > maxGrayLevel + 1:
+                raise ValueError("pixel is greater than max gray level")
+            histogram += counts
 
-    for rowPixel in pixels:
-        for pixel in rowPixel:
-            histogram[pixel] += 1
-    
     return histogram
 
-# main
-filepath = "in/scaled_shapes.pgm"
-width, height, maxGrayLevel, pixels = readPGM(filepath)
-
-histogram = createHistogram(pixels, maxGrayLevel)
-print(histogram)
-print(histogram.index(4969))
-print(histogram.index(4956))
-print(histogram.index(7529))
-print(histogram.index(3460))
-print(histogram.index(4955))
-# 4969, 4956, 7529, 3460, 4955
\ No newline at end of file
+def createHistogramFromFile(filePath, blockRows=1024, processes=None):
+    """
+    Create histogram of raw pgm (P5) file that can be larger than memory.
+    The file is read in blocks of rows and partial histograms of blocks are added,
+    so peak memory depends on block size and not on image size. Rows can be split
+    across a process pool and partial histograms of processes are merged.
+
+    Parameters:
+    filePath(str): A path to pgm file.
+    blockRows(int): Number of rows of each block.
+    processes(int): Number of processes or None to count in this process.
+
+    Returns:
+    histogram(np.ndarray): histogram of pgm file with maxGrayLevel+1 int64 counts.
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale.
+
+    Raise:
+    ValueError: If the file type is not a P5 format.
+    """
+
+    with open(filePath, "rb") as file:
+        fileType, width, height, maxGrayLevel = readHeader(file)
+        offset = file.tell()
+    if fileType != "P5":
+        raise ValueError("not a PGM P5 format")
+
+    if not processes or processes <= 1:
+        histogram = histogramOfRows(filePath, offset, width, 0, height, maxGrayLevel, blockRows)
+        return histogram, width, height, maxGrayLevel
+
+    # pool is imported only when it is used so importing this module costs only numpy
+    import concurrent.futures
+
+    rowsPerProcess = -(-height // processes)
+    starts = range(0, height, rowsPerProcess)
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        parts = [executor.submit(histogramOfRows, filePath, offset, width, start,
+                                 min(start + rowsPerProcess, height), maxGrayLevel, blockRows)
+                 for start in starts]
+        histogram = sum((part.result() for part in parts), np.zeros(maxGrayLevel + 1, dtype=np.int64))
+
+    return histogram, width, height, maxGrayLevel
+
+if __name__ == "__main__":
+    filepath = "in/scaled_shapes.pgm"
+    width, height, maxGrayLevel, pixels = readPGM(filepath)
+
+    histogram = createHistogram(pixels, maxGrayLevel).tolist()
+    print(histogram)
+    print(histogram.index(4969))
+    print(histogram.index(4956))
+    print(histogram.index(7529))
+    print(histogram.index(3460))
+    print(histogram.index(4955))
+    # 4969, 4956, 7529, 3460, 4955
@@ -0,0 +1,378 @@
+import contextlib
+import itertools
+import os
+import re
+
+import numpy as np
+
+# bytes of plain pixels read at once
+PLAIN_BLOCK = 1 << 16
+
+# whitespace-separated token of plain pixels
+TOKEN = re.compile(rb"\S+")
+
+# magic number: (number of channels, raw binary samples)
+NETPBM_TYPES = {
+    "P2": (1, False),
+    "P3": (3, False),
+    "P5": (1, True),
+    "P6": (3, True),
+}
+
+def readToken(file):
+    """
+    Read next whitespace-separated token of header and skip comments.
+    Comment starts with '#' anywhere in header and runs until the end of line.
+    The whitespace byte that ends the token is consumed.
+
+    Parameter:
+    file(file): Binary file object.
+
+    Return:
+    token(str): Next token of header or empty string at the end of file.
+    """
+
+    token = b""
+    while True:
+        byte = file.read(1)
+        if not byte:
+            return token.decode()
+        if byte == b"#":
+            file.readline()
+            if token:
+                return token.decode()
+        elif byte.isspace():
+            if token:
+                return token.decode()
+        else:
+            token += byte
+
+def readTokens(file, count):
+    """
+    Read next count whitespace-separated tokens of plain (P2/P3) pixels and
+    nothing after them, so the next image of the file starts at the right place.
+    Tokens are read in blocks and file is moved back to the end of the last token,
+    file that cannot seek is read token by token.
+
+    Parameters:
+    file(file): Binary file object.
+    count(int): Number of tokens.
+
+    Return:
+    tokens(list): List of tokens, shorter than count at the end of file.
+    """
+
+    if not file.seekable():
+        tokens = []
+        while len(tokens) < count and (token := readToken(file)):
+            tokens.append(token)
+        return tokens
+
+    tokens = []
+    position = file.tell()
+    data = b""
+    while True:
+        block = file.read(PLAIN_BLOCK)
+        data += block
+        matches = list(TOKEN.finditer(data))
+        # token that touches the end of block may continue in the next block
+        cut = len(data)
+        if block and matches and matches[-1].end() == len(data):
+            cut = matches.pop().start()
+        need = count - len(tokens)
+        if len(matches) >= need:
+            tokens.extend(match.group() for match in matches[:need])
+            # the whitespace byte that ends the last token is consumed like readToken does
+            file.seek(position + min(matches[need - 1].end() + 1, len(data)))
+            return tokens
+        tokens.extend(match.group() for match in matches)
+        if not block:
+            return tokens
+        position += cut
+        data = data[cut:]
+
+def readHeader(file):
+    """
+    Read header of netpbm file token by token.
+    After this the file is positioned at the first pixel.
+
+    Parameter:
+    file(file): Binary file object that positioned at the start of header.
+
+    Returns:
+    fileType(str): Magic number of file e.g. 'P5', 'P6' or empty string at the end of file.
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale.
+
+    Raise:
+    ValueError: If the file type is not a P2, P3, P5 or P6 format or header is broken.
+    """
+
+    fileType = readToken(file)
+    if not fileType:
+        return fileType, 0, 0, 0
+    if fileType not in NETPBM_TYPES:
+        raise ValueError("not a PGM P2/P5 or PPM P3/P6 format")
+
+    try:
+        width, height, maxGrayLevel = (int(readToken(file)) for _ in range(3))
+    except ValueError:
+        raise ValueError("broken header of netpbm file")
+    if not 0 < maxGrayLevel < 65536:
+        raise ValueError("max gray level must be between 1 and 65535")
+
+    return fileType, width, height, maxGrayLevel
+
+def pixelType(maxGrayLevel):
+    """
+    Return dtype of pixel sample from max gray level.
+    Sample is 1 byte if max gray level less than 256 and 2 bytes big-endian otherwise.
+
+    Parameter:
+    maxGrayLevel(int): Max value of gray scale.
+
+    Return:
+    dtype(np.dtype): dtype of one pixel sample in pgm file.
+    """
+
+    if maxGrayLevel < 256:
+        return np.dtype(np.uint8)
+    return np.dtype('>u2')
+
+def readFrame(file, filePath=None):
+    """
+    Read one image from netpbm file at current position.
+    Raw pixels are memory-mapped when file path is given, otherwise read from file.
+
+    Parameters:
+    file(file): Binary file object that positioned at the start of header.
+    filePath(str): A path of the file to memory-map raw pixels or None.
+
+    Returns:
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale.
+    pixels(np.ndarray): Array (height, width) or (height, width, 3) of pixels
+    or None at the end of file.
+
+    Raise:
+    ValueError: If the file type is not supported, pixels are truncated or a
+    plain pixel is out of range 0 to max gray level.
+    """
+
+    fileType, width, height, maxGrayLevel = readHeader(file)
+    if not fileType:
+        return 0, 0, 0, None
+
+    channels, isRaw = NETPBM_TYPES[fileType]
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    dtype = pixelType(maxGrayLevel)
+    count = height * width * channels
+
+    if not isRaw:
+        values = readTokens(file, count)
+        if len(values) < count:
+            raise ValueError("pixels of netpbm file are truncated")
+        # samples are parsed to 64 bit first so values out of range are found before cast
+        try:
+            samples = np.array(values[:count]).astype(np.int64)
+        except (ValueError, OverflowError):
+            raise ValueError(f"pixel value of netpbm file is not an integer in range 0 to {maxGrayLevel}")
+        checkRange(samples, maxGrayLevel)
+        return width, height, maxGrayLevel, samples.astype(dtype.newbyteorder('=')).reshape(shape)
+
+    nbytes = count * dtype.itemsize
+    if filePath is not None:
+        offset = file.tell()
+        if os.path.getsize(filePath) - offset < nbytes:
+            raise ValueError("pixels of netpbm file are truncated")
+        pixels = np.memmap(filePath, dtype=dtype, mode='c', offset=offset, shape=shape)
+        file.seek(offset + nbytes)
+    else:
+        data = file.read(nbytes)
+        if len(data) < nbytes:
+            raise ValueError("pixels of netpbm file are truncated")
+        pixels = np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    return width, height, maxGrayLevel, pixels
+
+def readPGM(filePath):
+    """
+    Read a pgm or ppm file and return their header except format type and comment
+    and return pixels as ndarray that memory-mapped over the file.
+    Pixels are copy-on-write so changing pixels does not change the file.
+    Only the first image is read if the file contains many images.
+
+    Parameter:
+    filePath(str): A path to pgm file.
+
+    Returns:
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale.
+    pixels(np.ndarray): Array (height, width) of gray pixels or (height, width, 3)
+    of rgb pixels, dtype uint8 or uint16.
+
+    Raise:
+    ValueError: If the file type is not a P2, P3, P5 or P6 format.
+    """
+
+    with open(filePath, "rb") as file:
+        width, height, maxGrayLevel, pixels = readFrame(file, filePath)
+
+    if pixels is None:
+        raise ValueError("empty netpbm file")
+
+    return width, height, maxGrayLevel, pixels
+
+def iterPGM(fileInput):
+    """
+    Iterate images of concatenated multi-image pgm or ppm stream one image at a time.
+
+    Parameter:
+    fileInput(str or file): A path to pgm file or an already-open binary file object.
+
+    Yields:
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale.
+    pixels(np.ndarray): Array of pixels of one image.
+
+    Raise:
+    ValueError: If the file type is not a P2, P3, P5 or P6 format.
+    """
+
+    if hasattr(fileInput, "read"):
+        stream, filePath = contextlib.nullcontext(fileInput), None
+    else:
+        stream, filePath = open(fileInput, "rb"), fileInput
+
+    with stream as file:
+        while True:
+            width, height, maxGrayLevel, pixels = readFrame(file, filePath)
+            if pixels is None:
+                return
+            yield width, height, maxGrayLevel, pixels
+
+def openOutput(fileOutput):
+    """
+    Return context manager of output file that close the file only if it opened here.
+
+    Parameter:
+    fileOutput(str or file): A path of output file or an already-open binary file object.
+
+    Return:
+    file(context manager): Context manager that yield binary file object.
+    """
+
+    if hasattr(fileOutput, "write"):
+        return contextlib.nullcontext(fileOutput)
+    return open(fileOutput, "wb")
+
+def checkRange(values, maxGrayLevel):
+    """
+    Check that every value fits in 0 to max gray level before it is cast to
+    pixel sample, casting would wrap it silently.
+
+    Parameters:
+    values(np.ndarray): Pixels.
+    maxGrayLevel(int): Max value of gray scale.
+
+    Raise:
+    ValueError: If a value is less than 0 or greater than max gray level.
+    """
+
+    if values.dtype.kind == 'u' and np.iinfo(values.dtype).max <= maxGrayLevel:
+        return
+    if values.size and (values.min() < 0 or values.max() > maxGrayLevel):
+        raise ValueError(f"pixel value out of range 0 to {maxGrayLevel}")
+
+def writeRows(file, pixels, dtype, maxGrayLevel=None):
+    """
+    Write pixels row by row to file without building full-size copy of image.
+
+    Parameters:
+    file(file): Binary file object.
+    pixels(np.ndarray or iterable): 2D array of pixels or iterable of rows.
+    dtype(np.dtype): dtype of pixel sample in pgm file.
+    maxGrayLevel(int): Max value of gray scale to check pixels against or None to not check.
+
+    Raise:
+    ValueError: If a pixel is out of range 0 to max gray level.
+    """
+
+    if isinstance(pixels, np.ndarray) and pixels.dtype == dtype and pixels.flags.c_contiguous:
+        if maxGrayLevel is not None:
+            checkRange(pixels, maxGrayLevel)
+        file.write(pixels.data)
+        return
+
+    for row in pixels:
+        row = np.asarray(row)
+        if maxGrayLevel is not None:
+            checkRange(row, maxGrayLevel)
+        if row.dtype != dtype or not row.flags.c_contiguous:
+            row = np.ascontiguousarray(row, dtype=dtype)
+        file.write(row.data)
+
+def writeHeader(file, width, height, maxGrayLevel, isColor=False):
+    """
+    Write header of binary pgm (P5) or ppm (P6) file.
+
+    Parameters:
+    file(file): Binary file object.
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale of image.
+    isColor(bool): True to write ppm P6 header.
+    """
+
+    fileType = "P6" if isColor else "P5"
+    header = [fileType, str(width)+" "+str(height), str(maxGrayLevel)]
+    file.write("\n".join(header).encode() + b"\n")
+
+def writePGM(filePath, header, pixels):
+    """
+    Write binary pgm file from file path, header and pixels.
+
+    Parameters:
+    filePath(str or file): A path of output file or an already-open binary file object.
+    header(list): List of header of PGM file.
+    pixels(bytes): Pixels of output image.
+    """
+
+    with openOutput(filePath) as file:
+        file.write("\n".join(header).encode() + b"\n")
+        file.write(pixels)
+
+def writePixelsToPGM(filePathOutput , width, height, maxGrayLevel, pixels, isColor=None):
+    """
+    Write pixels to PGM file by streaming each row straight to the file.
+    Pixels with three channels are written as PPM P6 file.
+
+    Parameters:
+    filePathOutput(str or file): A path of output file or an already-open binary file object.
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale of image.
+    pixels(np.ndarray or iterable): Array of pixels or iterable of rows.
+    isColor(bool): True to write ppm P6 file or None to find it from pixels,
+    from the first row if pixels is not an array so rows are never copied.
+
+    Raise:
+    ValueError: If a pixel is out of range 0 to max gray level.
+    """
+
+    if isColor is None:
+        if isinstance(pixels, np.ndarray):
+            isColor = pixels.ndim == 3
+        else:
+            rows = iter(pixels)
+            first = next(rows, None)
+            isColor = first is not None and np.ndim(first) == 2
+            pixels = rows if first is None else itertools.chain([first], rows)
+
+    with openOutput(filePathOutput) as file:
+        writeHeader(file, width, height, maxGrayLevel, isColor)
+        writeRows(file, pixels, pixelType(maxGrayLevel), maxGrayLevel)
@@ -0,0 +1,142 @@
+import numpy as np
+
+# neighbour offsets (row, column) that are already visited in raster order
+OFFSETS = {
+    4: [(0, 1), (1, 0)],
+    8: [(0, 1), (1, 0), (1, 1), (1, -1)],
+}
+
+def mergeEquivalences(parent, a, b):
+    """
+    Union labels a[i] and b[i] for every i in vectorized union-find.
+    Root with larger label is hooked to the smaller root and then paths are
+    compressed by pointer jumping, repeat until every pair has the same root.
+
+    Parameters:
+    parent(np.ndarray): Parent of each label that every label points to its root.
+    a(np.ndarray): First label of each pair.
+    b(np.ndarray): Second label of each pair.
+
+    Return:
+    parent(np.ndarray): Parent of each label that every label points to its root.
+    """
+
+    while True:
+        rootA = parent[a]
+        rootB = parent[b]
+        different = rootA != rootB
+        if not different.any():
+            return parent
+        a = a[different]; b = b[different]
+        rootA = rootA[different]; rootB = rootB[different]
+        np.minimum.at(parent, np.maximum(rootA, rootB), np.minimum(rootA, rootB))
+
+        while True:
+            grandParent = parent[parent]
+            if np.array_equal(grandParent, parent):
+                break
+            parent = grandParent
+
+def neighbourPairs(upper, lower, connectivity, background):
+    """
+    Find pairs of connected pixels between row block upper and row block lower,
+    pixels are connected if they are neighbours with the same value.
+
+    Parameters:
+    upper(np.ndarray): 2D pixels of upper block.
+    lower(np.ndarray): 2D pixels of lower block that starts right after upper, or
+    upper itself to find pairs inside one block.
+    connectivity(int): 4 or 8.
+    background(int): Value of background that is never connected or None.
+
+    Return:
+    pairs(list): List of (indexUpper, indexLower) of flat index of connected pixels.
+    """
+
+    pairs = []
+    height, width = upper.shape
+    same = lower is upper
+    index = np.arange(upper.size).reshape(upper.shape)
+
+    for dx, dy in OFFSETS[connectivity]:
+        if same:
+            rows = slice(0, height - dx)
+            target = lower[dx:]
+            targetIndex = index[dx:]
+        else:
+            if dx == 0:
+                continue
+            rows = slice(height - 1, height)
+            target = lower[:1]
+            targetIndex = np.arange(width).reshape(1, width)
+        source = upper[rows, max(0, -dy):width - max(0, dy)]
+        target = target[:, max(0, dy):width - max(0, -dy)]
+        connected = source == target
+        if background is not None:
+            connected &= source != background
+        sourceIndex = index[rows, max(0, -dy):width - max(0, dy)]
+        targetIndex = targetIndex[:, max(0, dy):width - max(0, -dy)]
+        pairs.append((sourceIndex[connected], targetIndex[connected]))
+
+    return pairs
+
+def labelComponents(pixels, connectivity=8, background=None, stripRows=256):
+    """
+    Label connected components of image by two-pass union-find over strips.
+    Neighbouring pixels that have the same value are in the same component so
+    every object of every gray level is labelled at once without binary masks.
+    First pass labels each strip and records equivalences with the previous strip,
+    second pass relabels every strip to consecutive labels.
+
+    Parameters:
+    pixels(list or np.ndarray): 2D pixels of image.
+    connectivity(int): 4 or 8.
+    background(int): Value of background pixels that get label 0 or None.
+    stripRows(int): Number of rows of each strip.
+
+    Returns:
+    labels(np.ndarray): 2D int32 label of each pixel, 0 for background,
+    1 to count for components.
+    count(int): Number of components.
+
+    Raise:
+    ValueError: If connectivity is not 4 or 8.
+    """
+
+    if connectivity not in OFFSETS:
+        raise ValueError("connectivity must be 4 or 8")
+
+    pixels = np.asarray(pixels)
+    height, width = pixels.shape
+    labels = np.zeros((height, width), dtype=np.int32)
+    equivalences = []
+    count = 0
+
+    # first pass
+    for start in range(0, height, stripRows):
+        strip = pixels[start:start + stripRows]
+        a, b = zip(*neighbourPairs(strip, strip, connectivity, background))
+        parent = mergeEquivalences(np.arange(strip.size), np.concatenate(a), np.concatenate(b))
+
+        foreground = np.ones(strip.shape, dtype=bool) if background is None else strip != background
+        roots, local = np.unique(parent.reshape(strip.shape)[foreground], return_inverse=True)
+        labels[start:start + stripRows][foreground] = local + count + 1
+        count += len(roots)
+
+        if start > 0:
+            previous = pixels[start - 1:start]
+            for a, b in neighbourPairs(previous, strip, connectivity, background):
+                equivalences.append((labels[start - 1, a], labels[start, b]))
+
+    # merge labels across strips
+    a, b = zip(*equivalences) if equivalences else ([np.zeros(0, dtype=np.int32)],) * 2
+    parent = mergeEquivalences(np.arange(count + 1), np.concatenate(a), np.concatenate(b))
+    roots, lookUpTable = np.unique(parent, return_inverse=True)
+    lookUpTable = lookUpTable.astype(np.int32)
+
+    # second pass
+    for start in range(0, height, stripRows):
+        strip = labels[start:start + stripRows]
+        np.take(lookUpTable, strip, out=strip)
+
+    return labels, len(roots) - 1
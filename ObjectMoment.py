@@ -1,90 +1,327 @@
-def readPGM(filepath):
+import math
+
+import numpy as np
+
+from ImageIO import readPGM
+from Labeling import labelComponents
+
+# number of pixels of one tile of moment accumulation
+TILE_PIXELS = 1 << 18
+
+def labelTiles(pixels):
+    """
+    Yield labels, rows and columns of pixels of each tile of TILE_PIXELS pixels.
+
+    Parameter:
+    pixels(list or np.ndarray): 2D pixels that each pixel is label of its object.
     """
-    Read a pgm file and return their header except format type and comment 
-    and return number of pixels.
 
-    Rarameter:
-    filepath(str): A path to pgm file.
+    pixels = np.asarray(pixels)
+    height, width = pixels.shape
+    step = max(1, TILE_PIXELS // max(1, width))
+    columns = np.arange(width, dtype=np.float64)
+
+    for start in range(0, height, step):
+        rows = min(step, height - start)
+        x = np.repeat(np.arange(start, start + rows, dtype=np.float64), width)
+        yield pixels[start:start + step].ravel(), x, np.tile(columns, rows)
+
+def powerSums(labels, x, y, order, count):
+    """
+    Sum x**p * y**q with p + q <= order over pixels of every label by weighted bincount.
+
+    Parameters:
+    labels(np.ndarray): 1D labels of pixels.
+    x(np.ndarray): Row of each pixel or its offset from origin of its label.
+    y(np.ndarray): Column of each pixel or its offset from origin of its label.
+    order(int): Max order p + q of moments.
+    count(int): Number of labels in result.
 
     Return:
-    width(int): Width of image.
-    height(int): Height of image.
-    maxGrayLevel(int): Max value of gray scale.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    sums(np.ndarray): Array (count, order+1, order+1) of sums s[label, p, q].
+    """
 
-    Raise:
-    ValueError: If the file type is not a P5 format.
+    sums = np.zeros((count, order + 1, order + 1))
+    yPowers = [np.ones_like(y)]
+    for q in range(order):
+        yPowers.append(yPowers[-1] * y)
+    xPower = np.ones_like(x)
+
+    for p in range(order + 1):
+        for q in range(order + 1 - p):
+            sums[:, p, q] = np.bincount(labels, weights=xPower * yPowers[q], minlength=count)
+        xPower *= x
+
+    return sums
+
+def growLabels(array, count):
+    """
+    Return array padded with zeros to at least count labels (rows).
     """
 
-    file = open(filepath,"rb")
+    if count <= len(array):
+        return array
+    return np.concatenate((array, np.zeros((count - len(array),) + array.shape[1:])))
 
-    fileType = file.readline().decode().strip()
-    if fileType != "P5":
-        raise ValueError("not a PGM P5 format")
-    
-    while True:
-        line = file.readline().decode().strip()
-        if not line.startswith('#'):
-            dimension = line
-            break
+def accumulateMoments(pixels, order=3, labelCount=0):
+    """
+    Compute raw moments m_pq = sum(x**p * y**q) with p + q <= order of every
+    label (gray level) of image in one pass by weighted bincount over labels.
+    x is row and y is column of pixel.
 
-    maxGrayLevel = int(file.readline().decode().strip())
-    width, height = dimension.split()
-    width = int(width); height = int(height)
+    Parameters:
+    pixels(list or np.ndarray): 2D pixels that each pixel is label of its object.
+    order(int): Max order p + q of moments.
+    labelCount(int): Min number of labels in result.
 
-    pixel_data = file.read()
-    pixels = [ list(pixel_data[row * width : (row + 1) * width]) for row in range(height)]
+    Return:
+    moments(np.ndarray): Array (labels, order+1, order+1) of raw moments m[label, p, q].
+    """
 
-    return width, height, maxGrayLevel, pixels
+    moments = np.zeros((labelCount, order + 1, order + 1))
+    for labels, x, y in labelTiles(pixels):
+        moments = growLabels(moments, int(labels.max()) + 1)
+        moments += powerSums(labels, x, y, order, len(moments))
 
-def pqMoment(pixels, p, q, width, height, color):
-    moment = 0
+    return moments
+
+def accumulateCentralMoments(pixels, order=3, labelCount=0):
+    """
+    Compute central moments of every label in one pass. Each tile takes moments
+    of every label about centroid of its pixels in that tile, and they are shifted
+    in closed form onto centroid of all pixels of the label seen so far. Moments
+    are never taken about origin of image, which cancel badly for small objects
+    far from the origin.
+
+    Parameters:
+    pixels(list or np.ndarray): 2D pixels that each pixel is label of its object.
+    order(int): Max order p + q of moments, at least 1.
+    labelCount(int): Min number of labels in result.
+
+    Returns:
+    moments(np.ndarray): Array (labels, 2, 2) of raw moments of order up to 1.
+    central(np.ndarray): Array (labels, order+1, order+1) of central moments,
+    nan for label that has no pixel.
+    """
+
+    order = max(order, 1)
+    moments = np.zeros((labelCount, 2, 2))
+    central = np.zeros((labelCount, order + 1, order + 1))
+
+    for labels, x, y in labelTiles(pixels):
+        moments = growLabels(moments, int(labels.max()) + 1)
+        central = growLabels(central, len(moments))
+        tileMoments = powerSums(labels, x, y, 1, len(moments))
+        present = np.flatnonzero(tileMoments[:, 0, 0])
 
-    for x in range(height):
-        for y in range(width):
-            if pixels[x][y] == color:
-                moment += x**p * y**q
+        origins = np.zeros((len(moments), 2))
+        origins[present] = centroidsOf(tileMoments[present])
+        tileCentral = powerSums(labels, x - origins[labels, 0], y - origins[labels, 1], order,
+                                len(moments))[present]
+
+        # labels without pixels yet have zero moments, their old centroid does not matter
+        before = np.nan_to_num(centroidsOf(moments[present]))
+        moments[present] += tileMoments[present]
+        after = centroidsOf(moments[present])
+        central[present] = (shiftMoments(central[present], before - after)
+                            + shiftMoments(tileCentral, origins[present] - after))
+
+    # what is left of first order moments after rounding of centroid is removed here
+    return moments, centralMomentsFromRaw(central)
+
+def centroidsOf(moments):
+    """
+    Return array (labels, 2) of centroid (x, y) of every label from its raw moments,
+    nan for label that has no pixel.
+    """
 
-    return moment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([moments[:, 1, 0], moments[:, 0, 1]], axis=1) / moments[:, :1, 0]
+
+def shiftMoments(moments, shift):
+    """
+    Move moments of every label to another origin in closed form by binomial
+    expansion of (x + dx)**p * (y + dy)**q.
+
+    Parameters:
+    moments(np.ndarray): Array (labels, order+1, order+1) of moments about old origin.
+    shift(np.ndarray): Array (labels, 2) of old origin minus new origin.
+
+    Return:
+    shifted(np.ndarray): Array (labels, order+1, order+1) of moments about new origin.
+    """
+
+    order = moments.shape[1] - 1
+    dx = shift[:, 0]
+    dy = shift[:, 1]
+
+    shifted = np.zeros_like(moments)
+    for p in range(order + 1):
+        for q in range(order + 1 - p):
+            for i in range(p + 1):
+                for j in range(q + 1):
+                    shifted[:, p, q] += (math.comb(p, i) * math.comb(q, j)
+                                         * dx ** (p - i) * dy ** (q - j) * moments[:, i, j])
+
+    return shifted
+
+def centralMomentsFromRaw(moments):
+    """
+    Compute central moments mu_pq of every label from raw moments in closed form.
+
+    Parameter:
+    moments(np.ndarray): Array (labels, order+1, order+1) of raw moments.
+
+    Return:
+    central(np.ndarray): Array (labels, order+1, order+1) of central moments,
+    nan for label that has no pixel.
+    """
+
+    return shiftMoments(moments, -centroidsOf(moments))
+
+def normalizedMomentsFromCentral(central):
+    """
+    Compute normalized central moments eta_pq = mu_pq / mu00**((p+q)/2 + 1) of every label.
+
+    Parameter:
+    central(np.ndarray): Array (labels, order+1, order+1) of central moments.
+
+    Return:
+    normalized(np.ndarray): Array (labels, order+1, order+1) of normalized moments.
+    """
+
+    order = central.shape[1] - 1
+    p, q = np.indices((order + 1, order + 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = central / central[:, :1, :1] ** ((p + q) / 2 + 1)
+
+    return normalized
+
+def huMoments(normalized):
+    """
+    Compute seven Hu invariant moments of every label from normalized moments.
+
+    Parameter:
+    normalized(np.ndarray): Array (labels, order+1, order+1) of normalized moments, order >= 3.
+
+    Return:
+    hu(np.ndarray): Array (labels, 7) of phi1 to phi7.
+    """
+
+    n20 = normalized[:, 2, 0]; n02 = normalized[:, 0, 2]; n11 = normalized[:, 1, 1]
+    n30 = normalized[:, 3, 0]; n03 = normalized[:, 0, 3]
+    n21 = normalized[:, 2, 1]; n12 = normalized[:, 1, 2]
+    a = n30 + n12
+    b = n21 + n03
+    c = n30 - 3 * n12
+    d = 3 * n21 - n03
+
+    hu = np.empty((len(normalized), 7))
+    hu[:, 0] = n20 + n02
+    hu[:, 1] = (n20 - n02) ** 2 + 4 * n11 ** 2
+    hu[:, 2] = c ** 2 + d ** 2
+    hu[:, 3] = a ** 2 + b ** 2
+    hu[:, 4] = c * a * (a ** 2 - 3 * b ** 2) + d * b * (3 * a ** 2 - b ** 2)
+    hu[:, 5] = (n20 - n02) * (a ** 2 - b ** 2) + 4 * n11 * a * b
+    hu[:, 6] = d * a * (a ** 2 - 3 * b ** 2) - c * b * (3 * a ** 2 - b ** 2)
+
+    return hu
+
+def featureTable(pixels, minArea=1, background=None, connectivity=None):
+    """
+    Compute features of every object (label) of image from one pass of
+    accumulateCentralMoments over pixels.
+    Labels are found from histogram of image (area of each label).
+    If connectivity is given, each connected component is an object so separate
+    shapes that share a gray level are not merged.
+
+    Parameters:
+    pixels(list or np.ndarray): 2D pixels that each pixel is label of its object.
+    minArea(int): Min number of pixels of label to be an object.
+    background(int): Label of background that is not an object or None.
+    connectivity(int): 4 or 8 to label connected components first or None.
+
+    Return:
+    table(dict): Columns of table that each is np.ndarray with one value per object,
+    'label', 'area', 'centroidX', 'centroidY', 'mu20', 'mu02', 'mu11',
+    'orientation' (radian of major axis from x axis), 'eccentricity' and 'phi1' to 'phi7'.
+    With connectivity there is also 'grayLevel' of each component.
+    """
+
+    pixels = np.asarray(pixels)
+    if connectivity is not None:
+        grayLevels = pixels
+        pixels, count = labelComponents(pixels, connectivity, background)
+        background = 0
+
+    moments, central = accumulateCentralMoments(pixels, 3)
+    histogram = moments[:, 0, 0]
+    keep = histogram >= max(minArea, 1)
+    if background is not None and background < len(keep):
+        keep[background] = False
+    labels = np.flatnonzero(keep)
+
+    moments = moments[labels]
+    central = central[labels]
+    hu = huMoments(normalizedMomentsFromCentral(central))
+    mu20 = central[:, 2, 0]
+    mu02 = central[:, 0, 2]
+    mu11 = central[:, 1, 1]
+    root = np.sqrt((mu20 - mu02) ** 2 + 4 * mu11 ** 2)
+    major = mu20 + mu02 + root
+    minor = mu20 + mu02 - root
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eccentricity = np.sqrt(np.clip(1 - minor / major, 0, 1))
+
+    table = {
+        'label': labels,
+        'area': moments[:, 0, 0].astype(np.int64),
+        'centroidX': moments[:, 1, 0] / moments[:, 0, 0],
+        'centroidY': moments[:, 0, 1] / moments[:, 0, 0],
+        'mu20': mu20,
+        'mu02': mu02,
+        'mu11': mu11,
+        'orientation': 0.5 * np.arctan2(2 * mu11, mu20 - mu02),
+        'eccentricity': np.where(major > 0, eccentricity, 0),
+    }
+    for i in range(7):
+        table[f'phi{i+1}'] = hu[:, i]
+    if connectivity is not None:
+        grayLevel = np.zeros(count + 1, dtype=grayLevels.dtype)
+        grayLevel[pixels] = grayLevels
+        table['grayLevel'] = grayLevel[labels]
+
+    return table
+
+def pqMoment(pixels, p, q, width, height, color):
+    moments = accumulateMoments(np.asarray(pixels)[:height, :width], p + q, color + 1)
+
+    return moments[color, p, q]
 
 def centralMoments(pixels, p, q, width, height, color):
-    moment = 0
-    m10 = pqMoment(pixels, 1, 0, width, height, color)
-    m01 = pqMoment(pixels, 0, 1, width, height, color)
-    m00 = pqMoment(pixels, 0, 0, width, height, color)
-    xQuantity = m10 / m00
-    yQuantity = m01 / m00   
-    
-    for x in range(height):
-        for y in range(width):
-            if pixels[x][y] == color:
-                moment += (x - xQuantity)**p * (y - yQuantity)**q
+    central = accumulateCentralMoments(np.asarray(pixels)[:height, :width], p + q, color + 1)[1]
 
-    return moment
+    return central[color, p, q]
 
 def normalizedMoments(pixels, p, q, width, height, color):
-    mupq = centralMoments(pixels, p, q, width, height, color)
-    mu00 = centralMoments(pixels, 0, 0, width, height, color)
-    moment = mupq / (mu00**((p+q)/2 + 1))
+    central = accumulateCentralMoments(np.asarray(pixels)[:height, :width], p + q, color + 1)[1]
 
-    return moment
+    return normalizedMomentsFromCentral(central)[color, p, q]
 
 def phi1(centralMoment20, centralMoment02):
     return centralMoment20 + centralMoment02
 
 # main
-filepath = "in/scaled_shapes.pgm"
-width, height, maxGrayLevel, pixels = readPGM(filepath)
-
-color = [0, 80, 120, 160, 200]
-print(f"{'Object':^10} {'Gray Level':^12} {'Central Moment20':^18} {'Central Moment02':^18} {'Phi1':^10}")
-print('-' * 72)
-
-for i, c in enumerate(color):
-    mu20 = centralMoments(pixels, 2, 0, width, height, c)
-    mu02 = centralMoments(pixels, 0, 2, width, height, c)
-    eta20 = normalizedMoments(pixels, 2, 0, width, height, c)
-    eta02 = normalizedMoments(pixels, 0, 2, width, height, c)
-    
-    print(f"{i+1:^10} {c:^12} {mu20:^18.2f} {mu02:^18.2f} {phi1(eta20, eta02):^10.2f}")
+if __name__ == "__main__":
+    filepath = "in/scaled_shapes.pgm"
+    width, height, maxGrayLevel, pixels = readPGM(filepath)
 
+    table = featureTable(pixels, minArea=1000, background=255)
+    print(f"{'Object':^10} {'Gray Level':^12} {'Central Moment20':^18} {'Central Moment02':^18} {'Phi1':^10}")
+    print('-' * 72)
+
+    for i, c in enumerate(table['label']):
+        mu20 = table['mu20'][i]
+        mu02 = table['mu02'][i]
+    
+        print(f"{i+1:^10} {c:^12} {mu20:^18.2f} {mu02:^18.2f} {table['phi1'][i]:^10.2f}")
@@ -0,0 +1,304 @@
+import numpy as np
+
+from AlgebraicOP import compileExpression, evaluate
+from GeometricOP import BORDERS, INTERPOLATIONS, borderIndex, interpolate, warpMap
+from Histogram import createHistogram
+from ImageIO import openOutput, pixelType, readPGM, writeHeader, writeRows
+from PointOP import applyTable, equalizationTable
+
+# number of pixels of one tile of rows that flows through the pipeline
+TILE_PIXELS = 1 << 20
+
+# rows around base row that each interpolation reads
+FOOTPRINTS = {'nearest': (0, 1), 'bilinear': (0, 1), 'bicubic': (-1, 2)}
+
+class Stage:
+    """
+    Node of lazy pipeline graph. Stage computes any band of rows on demand by
+    pulling the rows it needs from its inputs, nothing runs until write or
+    collect pulls tiles from the last stage. The last band of each stage is kept,
+    so a stage that feeds many stages is computed once per tile and only a few
+    tiles are alive at once whatever the size of image.
+    """
+
+    def __init__(self, shape, maxGrayLevel, dtype):
+        self.shape = tuple(shape)
+        self.maxGrayLevel = maxGrayLevel
+        self.dtype = np.dtype(dtype)
+        self.band = None
+
+    def rows(self, start, stop):
+        """
+        Return rows start to stop of output of stage.
+
+        Parameters:
+        start(int): First row.
+        stop(int): Row after the last row.
+
+        Return:
+        pixels(np.ndarray): Array of rows.
+        """
+
+        if self.band is None or self.band[:2] != (start, stop):
+            self.band = (start, stop, self.compute(start, stop))
+        return self.band[2]
+
+    def compute(self, start, stop):
+        raise NotImplementedError
+
+    def tiles(self, tileRows=None):
+        """
+        Yield (start, stop) of each tile of rows of output of stage.
+
+        Parameter:
+        tileRows(int): Number of rows of each tile or None for TILE_PIXELS pixels.
+        """
+
+        if tileRows is None:
+            tileRows = max(1, TILE_PIXELS // max(1, int(np.prod(self.shape[1:]))))
+        for start in range(0, self.shape[0], tileRows):
+            yield start, min(start + tileRows, self.shape[0])
+
+    def table(self, lookUpTable):
+        return table(self, lookUpTable)
+
+    def equalize(self):
+        return Equalize(self)
+
+    def expression(self, expressionText, name='p', maxGrayLevel=None, **inputs):
+        return expression(expressionText, maxGrayLevel, **{name: self}, **inputs)
+
+    def warp(self, warp, interpolation='bilinear', border='replicate', borderValue=0):
+        return Warp(self, warp, interpolation, border, borderValue)
+
+    def write(self, filePath, tileRows=None):
+        write(self, filePath, tileRows)
+
+    def collect(self, tileRows=None):
+        return collect(self, tileRows)
+
+class Read(Stage):
+    """
+    Source stage of pgm or ppm file. Raw pixels are memory-mapped, so rows are
+    read from disk only when a tile pulls them.
+    """
+
+    def __init__(self, filePath):
+        width, height, maxGrayLevel, self.pixels = readPGM(filePath)
+        super().__init__(self.pixels.shape, maxGrayLevel, self.pixels.dtype.newbyteorder('='))
+
+    def compute(self, start, stop):
+        return np.asarray(self.pixels[start:stop], dtype=self.dtype)
+
+class Table(Stage):
+    """
+    Point operation by look-up table, e.g. from gammaTable or equalizationTable.
+    """
+
+    def __init__(self, input, lookUpTable, maxGrayLevel=None):
+        lookUpTable = np.asarray(lookUpTable)
+        super().__init__(input.shape, input.maxGrayLevel if maxGrayLevel is None else maxGrayLevel,
+                         lookUpTable.dtype)
+        self.input = input
+        self.lookUpTable = lookUpTable
+
+    def compute(self, start, stop):
+        return applyTable(self.input.rows(start, stop), self.lookUpTable)
+
+class Equalize(Table):
+    """
+    Histogram equalization. Table needs histogram of the whole input, so the
+    first tile that is pulled streams input once tile by tile to count it.
+    Tables after equalization are kept as post table and composed with the
+    equalization table once it is built, so equalize then arithmetic is one np.take.
+    """
+
+    def __init__(self, input, postTable=None, base=None):
+        dtype = pixelType(input.maxGrayLevel).newbyteorder('=') if postTable is None else postTable.dtype
+        super().__init__(input, np.zeros(0, dtype=dtype))
+        self.lookUpTable = None
+        self.postTable = postTable
+        # stage that owns the histogram, equalize stages fused from it count the input only once
+        self.base = self if base is None else base
+        self.equalization = None
+
+    def compute(self, start, stop):
+        if self.lookUpTable is None:
+            base = self.base
+            if base.equalization is None:
+                maxGrayLevel = base.input.maxGrayLevel
+                histogram = np.zeros(maxGrayLevel + 1, dtype=np.int64)
+                for tileStart, tileStop in base.input.tiles():
+                    histogram += createHistogram(base.input.rows(tileStart, tileStop), maxGrayLevel)
+                base.equalization = equalizationTable(histogram, maxGrayLevel)
+            self.lookUpTable = base.equalization
+            if self.postTable is not None:
+                self.lookUpTable = applyTable(base.equalization, self.postTable)
+        return super().compute(start, stop)
+
+class Expression(Stage):
+    """
+    Arithmetic expression of stages and numbers evaluated by AlgebraicOP.evaluate
+    on each tile, e.g. Expression("3*g - (r + g + b)", 255, r=red, g=green, b=blue).
+    """
+
+    def __init__(self, expressionText, maxGrayLevel=None, **inputs):
+        self.stages = {name: value for name, value in inputs.items() if isinstance(value, Stage)}
+        self.numbers = {name: value for name, value in inputs.items() if not isinstance(value, Stage)}
+        if not self.stages:
+            raise ValueError("Expression must contain at least one stage")
+        shapes = {stage.shape for stage in self.stages.values()}
+        if len(shapes) != 1:
+            raise ValueError("Stages of expression must have the same shape")
+        if maxGrayLevel is None:
+            maxGrayLevel = max(stage.maxGrayLevel for stage in self.stages.values())
+        super().__init__(shapes.pop(), maxGrayLevel, pixelType(maxGrayLevel).newbyteorder('='))
+        self.expressionText = expressionText
+
+    def compute(self, start, stop):
+        values = {name: stage.rows(start, stop) for name, stage in self.stages.items()}
+        return evaluate(self.expressionText, self.maxGrayLevel, **values, **self.numbers)
+
+class Warp(Stage):
+    """
+    Geometric warp by warp map of GeometricOP. Each output tile pulls only the
+    band of input rows that its coordinates touch.
+    """
+
+    def __init__(self, input, warp, interpolation='bilinear', border='replicate', borderValue=0):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError("interpolation must be one of " + ", ".join(INTERPOLATIONS))
+        if border not in BORDERS:
+            raise ValueError("border must be one of " + ", ".join(BORDERS))
+        if isinstance(warp, tuple):
+            warp = warpMap(*warp)
+        super().__init__(warp['baseX'].shape + input.shape[2:], input.maxGrayLevel, input.dtype)
+        self.input = input
+        self.warp = warp
+        self.interpolation = interpolation
+        self.border = border
+        self.borderValue = borderValue
+
+    def compute(self, start, stop):
+        baseX = np.asarray(self.warp['baseX'][start:stop], dtype=np.intp)
+        baseY = np.asarray(self.warp['baseY'][start:stop], dtype=np.intp)
+        height = self.input.shape[0]
+        first, last = FOOTPRINTS[self.interpolation]
+        low = min(borderIndex(baseX + dx, height, self.border)[0].min() for dx in range(first, last + 1))
+        high = max(borderIndex(baseX + dx, height, self.border)[0].max() for dx in range(first, last + 1))
+        band = self.input.rows(low, high + 1)
+
+        values = interpolate(band, baseX, baseY, np.asarray(self.warp['fractionX'][start:stop]),
+                             np.asarray(self.warp['fractionY'][start:stop]), self.interpolation,
+                             self.border, self.borderValue, origin=low, height=height)
+        if self.dtype.kind in 'ui':
+            values = np.clip(np.rint(values), 0, self.maxGrayLevel)
+        return values.astype(self.dtype)
+
+def read(filePath):
+    """
+    Start pipeline from pgm or ppm file.
+
+    Parameter:
+    filePath(str): A path to pgm file.
+
+    Return:
+    stage(Read): Source stage.
+    """
+
+    return Read(filePath)
+
+def table(input, lookUpTable):
+    """
+    Add look-up table stage. Table after table or after equalization is fused
+    into one composed table so the chain is still one np.take per pixel.
+
+    Parameters:
+    input(Stage): Input stage.
+    lookUpTable(np.ndarray): Look-up table of each gray level.
+
+    Return:
+    stage(Table): Table stage.
+    """
+
+    lookUpTable = np.asarray(lookUpTable)
+    if type(input) is Table:
+        return Table(input.input, applyTable(input.lookUpTable, lookUpTable), input.maxGrayLevel)
+    if type(input) is Equalize:
+        if input.postTable is not None:
+            lookUpTable = applyTable(input.postTable, lookUpTable)
+        fused = Equalize(input.input, lookUpTable, input.base)
+        fused.maxGrayLevel = input.maxGrayLevel
+        return fused
+    return Table(input, lookUpTable)
+
+def expression(expressionText, maxGrayLevel=None, **inputs):
+    """
+    Add arithmetic expression stage. Expression of one integer stage and numbers
+    is a point operation, so it is evaluated once per gray level into a look-up
+    table and fused with the table before it, e.g. table then "2*p - 10" is one np.take.
+
+    Parameters:
+    expressionText(str): Expression e.g. "2*g - r - b".
+    maxGrayLevel(int): Max value of gray scale of output or None for max of inputs.
+    inputs: Stage or number of each name in expression.
+
+    Return:
+    stage(Stage): Expression stage or fused Table stage.
+
+    Raise:
+    ValueError: If expression is invalid or stages have different shape.
+    """
+
+    _, names, _ = compileExpression(expressionText)
+    missing = names - inputs.keys()
+    if missing:
+        raise ValueError(f"Missing value of {', '.join(sorted(missing))}")
+
+    stages = {name: value for name, value in inputs.items() if isinstance(value, Stage)}
+    if len(stages) == 1:
+        (name, input), = stages.items()
+        if input.dtype.kind == 'u':
+            if maxGrayLevel is None:
+                maxGrayLevel = input.maxGrayLevel
+            levels = np.arange(input.maxGrayLevel + 1)
+            numbers = {key: value for key, value in inputs.items() if key != name}
+            lookUpTable = evaluate(expressionText, maxGrayLevel, **{name: levels}, **numbers)
+            fused = table(input, lookUpTable)
+            fused.maxGrayLevel = maxGrayLevel
+            return fused
+
+    return Expression(expressionText, maxGrayLevel, **inputs)
+
+def write(stage, filePath, tileRows=None):
+    """
+    Run pipeline and write output of stage to pgm or ppm file tile by tile.
+
+    Parameters:
+    stage(Stage): Last stage.
+    filePath(str or file): A path of output file or an already-open binary file object.
+    tileRows(int): Number of rows of each tile or None for TILE_PIXELS pixels.
+    """
+
+    height, width = stage.shape[:2]
+    with openOutput(filePath) as file:
+        writeHeader(file, width, height, stage.maxGrayLevel, len(stage.shape) == 3)
+        for start, stop in stage.tiles(tileRows):
+            writeRows(file, stage.rows(start, stop), pixelType(stage.maxGrayLevel), stage.maxGrayLevel)
+
+def collect(stage, tileRows=None):
+    """
+    Run pipeline and return output of stage as one array.
+
+    Parameters:
+    stage(Stage): Last stage.
+    tileRows(int): Number of rows of each tile or None for TILE_PIXELS pixels.
+
+    Return:
+    pixels(np.ndarray): Output of stage.
+    """
+
+    pixels = np.empty(stage.shape, dtype=stage.dtype)
+    for start, stop in stage.tiles(tileRows):
+        pixels[start:stop] = stage.rows(start, stop)
+    return pixels
@@ -1,172 +1,468 @@
-import matplotlib.pyplot as plt
+import collections
+import hashlib
+
 import numpy as np
 
-def readPGM(filePath):
-    """
-    Read a pgm file and return their header except format type and comment 
-    and return number of pixels.
+from Histogram import createHistogram
+from ImageIO import pixelType, readPGM, writePixelsToPGM
 
-    Parameter:
-    filePath(str): A path to pgm file.
+# number of pixels of one block of CLAHE blending, float32 temporaries of a block stay in cache
+BLEND_PIXELS = 1 << 16
 
-    Returns:
+def equalize(inputHistogram, width, height, maxGrayLevel):
+    """
+    Histogram equalization by performing the input histogram.
+    
+    Parameters:
+    inputHistogram(np.array): Histogram of input image.
     width(int): Width of image.
     height(int): Height of image.
     maxGrayLevel(int): Max value of gray scale.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
-
-    Raise:
-    ValueError: If the file type is not a P5 format.
+    
+    Return:
+    equalization(np.array): Gray level that equalize input histogram.
     """
-
-    file = open(filePath,"rb")
-
-    fileType = file.readline().decode().strip()
-    if fileType != "P5":
-        raise ValueError("not a PGM P5 format")
     
-    while True:
-        line = file.readline().decode().strip()
-        if not line.startswith('#'):
-            dimension = line
-            break
+    A0 = width * height
+    PDF = inputHistogram / A0
+    CDF = np.cumsum(PDF)
+    equalization = maxGrayLevel * CDF
 
-    maxGrayLevel = int(file.readline().decode().strip())
-    width, height = map(int, dimension.split())
+    return equalization.round(0) 
 
-    pixel_data = file.read()
-    pixels = [ list(pixel_data[row * width : (row + 1) * width]) for row in range(height)]
+def mapHistogram(inputHistogram, equalization, maxGrayLevel):
+    """
+    Map value between input histogram and equalization and return output histogram.
+    
+    Parameters:
+    inputHistogram(np.array): Histogram of input image.
+    equalization(np.array): Gray level that equalize input histogram.
+    maxGrayLevel(int): Max value of gray scale.
+    
+    Return:
+    outputHistogram(np.array): Output histogram.
+    """
+    
+    outputHistogram = np.bincount(np.asarray(equalization, dtype=np.intp),
+                                  weights=inputHistogram, minlength=maxGrayLevel + 1)
 
-    return width, height, maxGrayLevel, pixels
+    return outputHistogram.astype(np.int64)
 
-def writePGM(filePath, header, pixels):
+class EqualizationCache:
+    """
+    LRU cache of equalization look-up tables keyed by quantized histogram digest.
+    Optionally the previous table is reused when the histogram is close to the
+    previous histogram, so steady frames of a stream skip building the table.
+    
+    Attributes:
+    hits(int): Number of tables found in cache.
+    misses(int): Number of tables that are built.
+    reuses(int): Number of times the previous table is reused.
     """
-    Write binary pgm file from file path, header and pixels.
+    
+    def __init__(self, maxSize=64, quantization=4096, reuseDistance=None):
+        """
+        Parameters:
+        maxSize(int): Max number of tables in cache.
+        quantization(int): Number of steps that each bin of normalized histogram is quantized to.
+        reuseDistance(float): Max L1 distance between normalized histograms (0 to 2) to
+        reuse the previous table or None to never reuse.
+        """
+        
+        self.maxSize = maxSize
+        self.quantization = quantization
+        self.reuseDistance = reuseDistance
+        self.tables = collections.OrderedDict()
+        self.previous = None
+        self.hits = 0
+        self.misses = 0
+        self.reuses = 0
+    
+    def lookUp(self, inputHistogram, width, height, maxGrayLevel):
+        """
+        Return equalization of input histogram from cache or build it.
+        
+        Parameters:
+        inputHistogram(np.array): Histogram of input image.
+        width(int): Width of image.
+        height(int): Height of image.
+        maxGrayLevel(int): Max value of gray scale.
+        
+        Return:
+        equalization(np.array): Gray level that equalize input histogram.
+        """
+        
+        PDF = np.asarray(inputHistogram) / (width * height)
+        if self.reuseDistance is not None and self.previous is not None:
+            previousPDF, previousTable = self.previous
+            if len(previousPDF) == len(PDF) and np.abs(PDF - previousPDF).sum() <= self.reuseDistance:
+                self.reuses += 1
+                return previousTable
+        
+        quantized = np.rint(PDF * self.quantization).astype(np.uint32)
+        key = (maxGrayLevel, hashlib.blake2b(quantized.tobytes(), digest_size=16).digest())
+        equalization = self.tables.get(key)
+        if equalization is None:
+            self.misses += 1
+            equalization = equalize(inputHistogram, width, height, maxGrayLevel).astype('int64')
+            self.tables[key] = equalization
+            if len(self.tables) > self.maxSize:
+                self.tables.popitem(last=False)
+        else:
+            self.hits += 1
+            self.tables.move_to_end(key)
+        self.previous = (PDF, equalization)
+        
+        return equalization
+
+def pointOperate(inputHistogram, width, height, maxGrayLevel, cache=None):
+    """
+    Point operation by equalizing the input histogram and return output histogram.
     
     Parameters:
-    filePath(str): A path of output file.
-    header(list): List of header of PGM file. 
-    pixels(bytes): Pixels of output image.
+    inputHistogram(np.array): Histogram of input image.
+    width(int): Width of image.
+    height(int): Height of image.
+    maxGrayLevel(int): Max value of gray scale.
+    cache(EqualizationCache): Cache of equalization or None to always build it.
+    
+    Return:
+    outputHistogram(np.array): Output histogram.
+    equalization(np.array): Gray level that equalize input histogram.
     """
     
-    file = open(filePath, "wb")
-    file.write("\n".join(header).encode() + b"\n")
-    file.write(pixels)
+    if cache is None:
+        equalization = equalize(inputHistogram, width, height, maxGrayLevel)
+        equalization = equalization.astype('int64')
+    else:
+        equalization = cache.lookUp(inputHistogram, width, height, maxGrayLevel)
+    outputHistogram = mapHistogram(inputHistogram, equalization, maxGrayLevel)
+    
+    return outputHistogram, equalization
 
-def createHistogram(pixels, maxGrayLevel):
+def toTable(values, maxGrayLevel):
     """
-    Create histogram by counting each pixel in pixels.
-
+    Round and saturate values of each gray level into look-up table.
+    
     Parameters:
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    values(np.array): Output value of each gray level.
     maxGrayLevel(int): Max value of gray scale.
-
+    
     Return:
-    histogram(list): histogram of pgm file.
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
     """
-
-    histogram = [0] * (maxGrayLevel + 1)
-
-    for rowPixel in pixels:
-        for pixel in rowPixel:
-            histogram[pixel] += 1
     
-    return histogram
+    values = np.clip(np.rint(np.asarray(values, dtype=np.float64)), 0, maxGrayLevel)
 
-def equalize(inputHistogram, width, height, maxGrayLevel):
+    return values.astype(pixelType(maxGrayLevel).newbyteorder('='))
+
+def equalizationTable(inputHistogram, maxGrayLevel):
     """
-    Histogram equalization by performing the input histogram.
+    Look-up table of histogram equalization of input histogram.
     
     Parameters:
     inputHistogram(np.array): Histogram of input image.
-    width(int): Width of image.
-    height(int): Height of image.
     maxGrayLevel(int): Max value of gray scale.
     
     Return:
-    equalization(np.array): Gray level that equalize input histogram.
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
     """
     
-    A0 = width * height
-    PDF = inputHistogram / A0
-    CDF = np.cumsum(PDF)
-    equalization = maxGrayLevel * CDF
+    inputHistogram = np.asarray(inputHistogram)
+    
+    return toTable(equalize(inputHistogram, inputHistogram.sum(), 1, maxGrayLevel), maxGrayLevel)
 
-    return equalization.round(0) 
+def gammaTable(gamma, maxGrayLevel):
+    """
+    Look-up table of gamma correction maxGrayLevel * (D / maxGrayLevel)**gamma.
+    
+    Parameters:
+    gamma(float): Gamma.
+    maxGrayLevel(int): Max value of gray scale.
+    
+    Return:
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
+    """
+    
+    levels = np.arange(maxGrayLevel + 1) / maxGrayLevel
+    
+    return toTable(maxGrayLevel * levels ** gamma, maxGrayLevel)
 
-def mapHistogram(inputHistogram, equalization, maxGrayLevel):
+def contrastStretchTable(low, high, maxGrayLevel):
     """
-    Map value between input histogram and equalization and return output histogram.
+    Look-up table of contrast stretch that map [low, high] to [0, maxGrayLevel].
     
     Parameters:
-    inputHistogram(np.array): Histogram of input image.
-    equalization(np.array): Gray level that equalize input histogram.
+    low(int): Gray level that map to 0.
+    high(int): Gray level that map to maxGrayLevel.
     maxGrayLevel(int): Max value of gray scale.
     
     Return:
-    outputHistogram(list): List of output histogram.
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
+    
+    Raise:
+    ValueError: If low is not less than high.
     """
     
-    outputHistogram = [0] * (maxGrayLevel + 1)
+    if low >= high:
+        raise ValueError("low must be less than high")
+    levels = np.arange(maxGrayLevel + 1)
     
-    for i in range(maxGrayLevel):
-        outputHistogram[equalization[i]] += inputHistogram[i] 
+    return toTable((levels - low) * maxGrayLevel / (high - low), maxGrayLevel)
 
-    return outputHistogram
+def thresholdTable(threshold, maxGrayLevel):
+    """
+    Look-up table of threshold, gray level at least threshold map to maxGrayLevel and others to 0.
+    
+    Parameters:
+    threshold(int): Threshold.
+    maxGrayLevel(int): Max value of gray scale.
+    
+    Return:
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
+    """
+    
+    levels = np.arange(maxGrayLevel + 1)
+    
+    return toTable(np.where(levels >= threshold, maxGrayLevel, 0), maxGrayLevel)
 
-def pointOperate(inputHistogram, width, height, maxGrayLevel):
+def functionTable(function, maxGrayLevel):
     """
-    Point operation by equalizing the input histogram and return output histogram.
+    Look-up table of any point operation, function is called once per gray level.
     
     Parameters:
-    inputHistogram(np.array): Histogram of input image.
-    width(int): Width of image.
-    height(int): Height of image.
+    function(callable): Function that map a gray level to output value.
     maxGrayLevel(int): Max value of gray scale.
     
     Return:
-    outputHistogram(list): List of output histogram.
-    equalization(np.array): Gray level that equalize input histogram.
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
     """
     
-    equalization = equalize(inputHistogram, width, height, maxGrayLevel)
-    equalization = equalization.astype('int64')
-    outputHistogram = mapHistogram(inputHistogram, equalization, maxGrayLevel)
+    return toTable([function(level) for level in range(maxGrayLevel + 1)], maxGrayLevel)
+
+def applyTable(pixels, table, out=None):
+    """
+    Apply look-up table to every pixel with one np.take.
     
-    return outputHistogram, equalization
+    Parameters:
+    pixels(np.array): Pixels of image.
+    table(np.array): Look-up table of each gray level.
+    out(np.array): Preallocated output or pixels itself to map in place, None to allocate.
+    
+    Return:
+    out(np.array): Mapped pixels.
+    
+    Raise:
+    ValueError: If a pixel is negative or not less than length of table.
+    """
+    
+    pixels = np.asarray(pixels)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.asarray(table).dtype)
+    table = np.asarray(table, dtype=out.dtype)
+    
+    # mode 'clip' lets np.take write to out without buffering, so range is checked here
+    # instead, a table that covers every value of pixel dtype needs no check
+    fits = pixels.dtype.kind == 'u' and np.iinfo(pixels.dtype).max < len(table)
+    if not fits and pixels.size and (pixels.min() < 0 or pixels.max() >= len(table)):
+        raise ValueError(f"pixel value out of range 0 to {len(table) - 1} of look-up table")
+    
+    return np.take(table, pixels, out=out, mode='clip')
 
 def mapColor(pixels, width, height, equalization):
     """
-    Map color between input image and equalization.
+    Map color between input image and equalization in place with look-up table.
     
     Parameters:
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    pixels(np.array): 2D pixels that contain each pixel in pgm file.
     width(int): Width of image.
     height(int): Height of image.
     equalization(np.array): Gray level that equalize input histogram.
     """
     
-    for x in range(height):
-        for y in range(width):
-            pixels[x][y] = equalization[pixels[x][y]]
+    applyTable(pixels[:height, :width], equalization, out=pixels[:height, :width])
 
-def writePixelsToPGM(filePathOutput , width, height, maxGrayLevel, pixels):
+def createCDF(inputHistogram):
     """
-    Write pixels to PGM file.
+    Cumulative distribution function of histogram.
+    
+    Parameter:
+    inputHistogram(np.array): Histogram of image.
+    
+    Return:
+    CDF(np.array): Fraction of pixels at or below each gray level.
+    """
+    
+    CDF = np.cumsum(inputHistogram, dtype=np.float64)
+    
+    return CDF / CDF[-1]
+
+def matchingTable(sourceHistogram, referenceCDF, maxGrayLevel):
+    """
+    Look-up table of histogram matching that map each gray level of source to the
+    smallest gray level of reference whose CDF reach CDF of source (inverse CDF).
     
     Parameters:
-    filePathOutput(str): A path of output file.
-    width(int): Width of image.
-    height(int): Height of image.
-    maxGrayLevel(int): Max value of gray scale of image.
-    pixels(list): 2D list of pixels that contain each pixel in pgm file.
+    sourceHistogram(np.array): Histogram of source image.
+    referenceCDF(np.array): CDF of reference image.
+    maxGrayLevel(int): Max value of gray scale.
+    
+    Return:
+    table(np.array): Look-up table of maxGrayLevel+1 gray levels.
+    """
+    
+    sourceCDF = createCDF(sourceHistogram)
+    # tolerance so that equal CDFs of float rounding map to the same level
+    levels = np.searchsorted(referenceCDF, sourceCDF - 1e-12, side='left')
+    
+    return toTable(np.minimum(levels, len(referenceCDF) - 1), maxGrayLevel)
+
+def matchHistogram(source, reference, maxGrayLevel, referenceCDF=None, out=None):
+    """
+    Histogram specification that map source image to have histogram of reference.
+    To match many frames against one reference compute referenceCDF once
+    with createCDF(createHistogram(reference, maxGrayLevel)) and pass it.
+    
+    Parameters:
+    source(np.array): 2D pixels of source image.
+    reference(np.array): 2D pixels of reference image, not used if referenceCDF is given.
+    maxGrayLevel(int): Max value of gray scale.
+    referenceCDF(np.array): Precomputed CDF of reference or None.
+    out(np.array): Preallocated output, source itself to map in place, or None to allocate.
+    
+    Return:
+    out(np.array): Matched pixels.
     """
     
-    header = ["P5", str(width)+" "+str(height), str(maxGrayLevel)]
-    pixels2Dto1D = bytes(sum(pixels, []))
-    pixels = pixels2Dto1D
-    writePGM(filePathOutput, header, pixels)
+    if referenceCDF is None:
+        referenceCDF = createCDF(createHistogram(reference, maxGrayLevel))
+    table = matchingTable(createHistogram(source, maxGrayLevel), referenceCDF, maxGrayLevel)
     
+    return applyTable(source, table, out)
+
+def tileWeights(length, tileSize):
+    """
+    Find two neighbouring tiles and bilinear weight of each row (or column) from tile centers.
+    
+    Parameters:
+    length(int): Number of rows (or columns) of image.
+    tileSize(int): Number of rows (or columns) of each tile.
+    
+    Returns:
+    first(np.array): Index of first tile of each row.
+    second(np.array): Index of second tile of each row.
+    weight(np.array): float32 weight of second tile of each row.
+    """
+    
+    starts = np.arange(0, length, tileSize)
+    centers = (starts + np.minimum(starts + tileSize, length) - 1) / 2
+    position = np.arange(length)
+    first = np.clip(np.searchsorted(centers, position, side='right') - 1, 0, len(centers) - 1)
+    second = np.minimum(first + 1, len(centers) - 1)
+    distance = centers[second] - centers[first]
+    weight = np.where(distance > 0, (position - centers[first]) / np.where(distance > 0, distance, 1), 0)
+    
+    return first, second, np.clip(weight, 0, 1).astype(np.float32)
+
+def blendCells(first, second):
+    """
+    Find runs of rows (or columns) that blend the same two tiles.
+    
+    Parameters:
+    first(np.array): Index of first tile of each row from tileWeights.
+    second(np.array): Index of second tile of each row from tileWeights.
+    
+    Return:
+    cells(list): List of (first tile, second tile, start, stop) of each run.
+    """
+    
+    starts = np.flatnonzero(np.diff(first, prepend=-1))
+    stops = np.append(starts[1:], len(first))
+    return [(first[start], second[start], start, stop) for start, stop in zip(starts, stops)]
+
+def clahe(pixels, maxGrayLevel, tiles=(8, 8), clipLimit=2.0, out=None, workers=None):
+    """
+    Contrast limited adaptive histogram equalization (CLAHE).
+    Histograms of all tiles are counted with one bincount per row of tiles, each
+    histogram is clipped at clipLimit times the mean count and the excess is
+    redistributed equally, then output is bilinear blending of look-up tables of
+    four nearest tiles, cell by cell between tile centers. Rows of tiles and rows
+    of cells are processed in a thread pool.
+    
+    Parameters:
+    pixels(np.array): 2D pixels of image.
+    maxGrayLevel(int): Max value of gray scale.
+    tiles(tuple): Number of tiles (rows, columns).
+    clipLimit(float): Max count of histogram bin relative to mean count, 0 for no clipping.
+    out(np.array): Preallocated output or None to allocate.
+    workers(int): Number of threads or None for number of cores.
+    
+    Return:
+    out(np.array): Equalized pixels.
+    """
+    
+    pixels = np.asarray(pixels)
+    height, width = pixels.shape
+    levels = maxGrayLevel + 1
+    tileHeight = -(-height // min(tiles[0], height))
+    tileWidth = -(-width // min(tiles[1], width))
+    tileRows = -(-height // tileHeight)
+    tileCols = -(-width // tileWidth)
+    columnOffset = (np.arange(width) // tileWidth * levels).astype(np.intp)
+    if out is None:
+        out = np.empty((height, width), dtype=pixelType(maxGrayLevel).newbyteorder('='))
+
+    def countTileRow(i):
+        block = pixels[i * tileHeight:(i + 1) * tileHeight]
+        counts = np.bincount((block + columnOffset).ravel(), minlength=tileCols * levels)
+        return counts.reshape(tileCols, levels)
+
+    # pool is imported only when it is used so importing this module costs only numpy
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        histograms = np.stack(list(executor.map(countTileRow, range(tileRows)))).astype(np.float64)
+
+        area = histograms.sum(axis=2, keepdims=True)
+        if clipLimit > 0:
+            limit = np.maximum(clipLimit * area / levels, 1)
+            excess = np.maximum(histograms - limit, 0).sum(axis=2, keepdims=True)
+            histograms = np.minimum(histograms, limit) + excess / levels
+        tables = (np.cumsum(histograms, axis=2) * (maxGrayLevel / area)).round().astype(np.float32)
+
+        rowFirst, rowSecond, rowWeight = tileWeights(height, tileHeight)
+        colFirst, colSecond, colWeight = tileWeights(width, tileWidth)
+        tables = tables.reshape(tileRows, tileCols, levels)
+        colCells = blendCells(colFirst, colSecond)
+
+        def blendCellRow(rowCell):
+            # pixels of a cell between four tile centers blend the same four tables, so
+            # each table is gathered with np.take in small blocks that stay in cache
+            top, bottom, start, stop = rowCell
+            for left, right, colStart, colStop in colCells:
+                # blend = corner + across * c + (down + twist * c) * r of column and row weights c and r
+                corner = tables[top, left]
+                across = tables[top, right] - corner
+                down = tables[bottom, left] - corner
+                twist = tables[bottom, right] - tables[bottom, left] - across
+                weight = colWeight[colStart:colStop]
+                step = max(1, BLEND_PIXELS // (colStop - colStart))
+                for first in range(start, stop, step):
+                    last = min(first + step, stop)
+                    values = pixels[first:last, colStart:colStop]
+                    blend = np.take(across, values)
+                    blend *= weight
+                    blend += np.take(corner, values)
+                    rowBlend = np.take(twist, values)
+                    rowBlend *= weight
+                    rowBlend += np.take(down, values)
+                    rowBlend *= rowWeight[first:last, None]
+                    blend += rowBlend
+                    out[first:last, colStart:colStop] = np.rint(blend, out=blend)
+
+        list(executor.map(blendCellRow, blendCells(rowFirst, rowSecond)))
+
+    return out
+
 def showHistogram(filePath, inputHistogram, equalization, outputHistogram):
     """
     Show histogram of input histogram, equalization and output histogram.
@@ -177,7 +473,10 @@ def showHistogram(filePath, inputHistogram, equalization, outputHistogram):
     equalization(np.array): Gray level that equalize input histogram.
     outputHistogram(list): List of output histogram.
     """
-    
+
+    # matplotlib is slow to import and only needed here
+    import matplotlib.pyplot as plt
+
     plt.subplot(1, 3, 1)
     plt.title(f'Input of histogram of {filePath}')
     plt.xlabel('Gray Level(D)')
@@ -198,44 +497,45 @@ def showHistogram(filePath, inputHistogram, equalization, outputHistogram):
     plt.show()
 
 # # main
-# filePathIn1 = "in/Cameraman.pgm"
-# filePathOut1 = "out/CameramanOut.pgm"
+if __name__ == "__main__":
+    # filePathIn1 = "in/Cameraman.pgm"
+    # filePathOut1 = "out/CameramanOut.pgm"
 
-# # read pgm file
-# width1, height1, maxGrayLevel1, pixels1 = readPGM(filePathIn1)
+    # # read pgm file
+    # width1, height1, maxGrayLevel1, pixels1 = readPGM(filePathIn1)
 
-# # perform histogram equalization
-# inputHistogram1 = np.array(createHistogram(pixels1, maxGrayLevel1))
-# outputHistogram1, equalization1 = pointOperate(inputHistogram1,  width1, height1, maxGrayLevel1)
-# mapColor(pixels1, width1, height1, equalization1)
+    # # perform histogram equalization
+    # inputHistogram1 = np.array(createHistogram(pixels1, maxGrayLevel1))
+    # outputHistogram1, equalization1 = pointOperate(inputHistogram1,  width1, height1, maxGrayLevel1)
+    # mapColor(pixels1, width1, height1, equalization1)
 
-# # write pgm file
-# writePixelsToPGM(filePathOut1 , width1, height1, maxGrayLevel1, pixels1)
+    # # write pgm file
+    # writePixelsToPGM(filePathOut1 , width1, height1, maxGrayLevel1, pixels1)
 
-# showHistogram(filePathIn1, inputHistogram1, equalization1, outputHistogram1)
+    # showHistogram(filePathIn1, inputHistogram1, equalization1, outputHistogram1)
 
-# # perform second image
-# filePathIn2 = "in/SEM256_256.pgm"
-# filePathOut2 = "out/SEM256_256Out.pgm"
+    # # perform second image
+    # filePathIn2 = "in/SEM256_256.pgm"
+    # filePathOut2 = "out/SEM256_256Out.pgm"
 
-# width2, height2, maxGrayLevel2, pixels2 = readPGM(filePathIn2)
+    # width2, height2, maxGrayLevel2, pixels2 = readPGM(filePathIn2)
 
-# inputHistogram2 = np.array(createHistogram(pixels2, maxGrayLevel2))
-# outputHistogram2, equalization2 = pointOperate(inputHistogram2, width2, height2, maxGrayLevel2)
-# mapColor(pixels2, width2, height2, equalization2)
+    # inputHistogram2 = np.array(createHistogram(pixels2, maxGrayLevel2))
+    # outputHistogram2, equalization2 = pointOperate(inputHistogram2, width2, height2, maxGrayLevel2)
+    # mapColor(pixels2, width2, height2, equalization2)
 
-# writePixelsToPGM(filePathOut2, width2, height2, maxGrayLevel2, pixels2)
-# showHistogram(filePathIn2, inputHistogram2, equalization2, outputHistogram2)
+    # writePixelsToPGM(filePathOut2, width2, height2, maxGrayLevel2, pixels2)
+    # showHistogram(filePathIn2, inputHistogram2, equalization2, outputHistogram2)
 
-# perform second image
-filePathIn3 = "in/62877.pgm"
-filePathOut3 = "out/62865Out.pgm"
+    # perform second image
+    filePathIn3 = "in/62877.pgm"
+    filePathOut3 = "out/62865Out.pgm"
 
-width3, height3, maxGrayLevel3, pixels3 = readPGM(filePathIn3)
+    width3, height3, maxGrayLevel3, pixels3 = readPGM(filePathIn3)
 
-inputHistogram3 = np.array(createHistogram(pixels3, maxGrayLevel3))
-outputHistogram3, equalization3 = pointOperate(inputHistogram3, width3, height3, maxGrayLevel3)
-mapColor(pixels3, width3, height3, equalization3)
+    inputHistogram3 = np.array(createHistogram(pixels3, maxGrayLevel3))
+    outputHistogram3, equalization3 = pointOperate(inputHistogram3, width3, height3, maxGrayLevel3)
+    mapColor(pixels3, width3, height3, equalization3)
 
-writePixelsToPGM(filePathOut3, width3, height3, maxGrayLevel3, pixels3)
-showHistogram(filePathIn3, inputHistogram3, equalization3, outputHistogram3)
\ No newline at end of file
+    writePixelsToPGM(filePathOut3, width3, height3, maxGrayLevel3, pixels3)
+    showHistogram(filePathIn3, inputHistogram3, equalization3, outputHistogram3)
\ No newline at end of file
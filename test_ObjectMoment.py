@@ -0,0 +1,20 @@
+import numpy as np
+
+from ObjectMoment import centralMoments, normalizedMoments, pqMoment
+
+def loopCentralMoment(pixels, p, q, color):
+    x, y = np.nonzero(pixels == color)
+    return ((x - x.mean()) ** p * (y - y.mean()) ** q).sum()
+
+def test_moments_match_per_pixel_definitions():
+    pixels = np.random.default_rng(0).integers(0, 8, (20, 20))
+    color = 5
+    x, y = np.nonzero(pixels == color)
+    mu00 = loopCentralMoment(pixels, 0, 0, color)
+
+    for p, q in ((0, 0), (1, 0), (2, 0)):
+        assert np.isclose(pqMoment(pixels, p, q, 20, 20, color), (x ** p * y ** q).sum())
+        mu = loopCentralMoment(pixels, p, q, color)
+        assert np.isclose(centralMoments(pixels, p, q, 20, 20, color), mu, atol=1e-9)
+        assert np.isclose(normalizedMoments(pixels, p, q, 20, 20, color),
+                          mu / mu00 ** ((p + q) / 2 + 1), atol=1e-12)